@@ -0,0 +1,537 @@
+"""Local stand-ins used by the benchmark: fake Nexus nodes + pastebin, an in-memory Mongo and a fake Telegram client."""
+import asyncio
+import gzip
+import itertools
+import json
+import random
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import httpx
+from pymongo.errors import DuplicateKeyError
+
+
+# ---------------------------------------------------------------------------
+# Fake Nexus cluster and pastebin
+# ---------------------------------------------------------------------------
+
+class FakeNexusTransport(httpx.AsyncBaseTransport):
+    """httpx transport that answers Nexus /status, /search and pastebin /api/paste locally.
+
+    Each /search streams `lines` result lines after `latency` seconds (+/- `jitter`), spread over
+    `stream_time` seconds. `error_rate` of searches answer HTTP 500 and `timeout_rate` hang forever.
+    The first `shared_lines` lines are identical on every node, to exercise cross-node deduplication.
+    The pastebin accepts gzipped bodies unless `paste_gzip` is False, in which case it answers 422 like a
+    JSON API that can't parse the body, and answers 503 to `paste_error_rate` of uploads. `tail_rate` of searches wait an extra `tail_latency`
+    seconds before answering, to exercise hedged requests. Replica hosts (node-1-r2) serve their shard's data.
+    A `deadline` query parameter (seconds) stops the stream early, like a node that kills ripgrep at the budget.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.1, lines: int = 200, stream_time: float = 0.1,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, paste_latency: float = 0.05, seed: int = 0,
+                 shared_lines: int = 0, paste_gzip: bool = True, paste_error_rate: float = 0.0,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.lines = lines
+        self.stream_time = stream_time
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.paste_latency = paste_latency
+        self.shared_lines = shared_lines
+        self.paste_gzip = paste_gzip
+        self.paste_error_rate = paste_error_rate
+        self.paste_failures = 0
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)
+        self.search_requests = 0
+        self.paste_requests = 0
+        self.paste_bytes = 0
+        self.lines_streamed = 0
+        self.deadline_stops = 0
+
+    async def _stream_lines(self, node: str, query: str, deadline: float | None = None):
+        node = re.sub(r"-r\d+", "", node)
+        chunks = 10
+        per_chunk = max(1, self.lines // chunks)
+        sent = 0
+        while sent < self.lines:
+            if deadline is not None and asyncio.get_running_loop().time() >= deadline:
+                self.deadline_stops += 1
+                return
+            count = min(per_chunk, self.lines - sent)
+            payload = "".join(
+                f"{'shared' if sent + i < self.shared_lines else node}/data/file{(sent + i) // 50}.txt:{sent + i}: {query} match {sent + i}\n"
+                for i in range(count)
+            )
+            sent += count
+            self.lines_streamed += count
+            yield payload.encode()
+            await asyncio.sleep(self.stream_time / chunks)
+
+    async def _hang(self):
+        await asyncio.sleep(3600)
+        yield b""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = urlsplit(str(request.url)).hostname or ""
+        path = request.url.path
+
+        if path == "/status":
+            return httpx.Response(200, json={"state": "done"})
+
+        if path == "/search":
+            self.search_requests += 1
+            roll = self.random.random()
+            if roll < self.error_rate:
+                await asyncio.sleep(self.latency)
+                return httpx.Response(500, text="injected error")
+            if roll < self.error_rate + self.timeout_rate:
+                return httpx.Response(200, content=self._hang())
+            # Time to first byte: the response headers only go out after this delay
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            if self.random.random() < self.tail_rate:
+                delay += self.tail_latency
+            await asyncio.sleep(max(0.0, delay))
+            query = request.url.params.get("search", "")
+            deadline = request.url.params.get("deadline")
+            if deadline is not None:
+                deadline = asyncio.get_running_loop().time() + float(deadline) - delay
+            return httpx.Response(200, content=self._stream_lines(host, query, deadline))
+
+        if path == "/api/paste":
+            body = await request.aread()
+            await asyncio.sleep(self.paste_latency)
+            if self.random.random() < self.paste_error_rate:
+                self.paste_failures += 1
+                return httpx.Response(503, text="injected error")
+            if request.headers.get("content-encoding") == "gzip":
+                if not self.paste_gzip:
+                    return httpx.Response(422, text="invalid JSON body")
+                raw = gzip.decompress(body)
+            else:
+                raw = body
+            try:
+                json.loads(raw)
+            except ValueError:
+                return httpx.Response(400, text="invalid json")
+            self.paste_requests += 1
+            self.paste_bytes += len(body)
+            return httpx.Response(201, json={"id": f"p{self.paste_requests}"})
+
+        return httpx.Response(404)
+
+
+# ---------------------------------------------------------------------------
+# In-memory Mongo stand-in (only the subset of the Motor API the bot uses)
+# ---------------------------------------------------------------------------
+
+def _rank(value):
+    # BSON comparison order for the types we store
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (4, value)
+    return (5, str(value))
+
+def _compare(a, b) -> int:
+    ra, rb = _rank(a), _rank(b)
+    return (ra > rb) - (ra < rb)
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, cond in query.items():
+        if field == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if field == "$and":
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$gt" and not (field in doc and _compare(value, arg) > 0):
+                    return False
+                if op == "$gte" and not (field in doc and _compare(value, arg) >= 0):
+                    return False
+                if op == "$lt" and not (field in doc and _compare(value, arg) < 0):
+                    return False
+                if op == "$lte" and not (field in doc and _compare(value, arg) <= 0):
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+                if op == "$exists" and (field in doc) != bool(arg):
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+def _eval(expr, doc: dict):
+    """Evaluates the aggregation expressions used in the bot's pipeline updates."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if isinstance(expr, list):
+        return [_eval(e, doc) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    if op == "$cond":
+        return _eval(args[1], doc) if _eval(args[0], doc) else _eval(args[2], doc)
+    values = [_eval(a, doc) for a in args] if isinstance(args, list) else [_eval(args, doc)]
+    if op in ("$lt", "$lte", "$gt", "$gte", "$eq", "$ne"):
+        c = _compare(values[0], values[1])
+        return {"$lt": c < 0, "$lte": c <= 0, "$gt": c > 0, "$gte": c >= 0, "$eq": c == 0, "$ne": c != 0}[op]
+    if op == "$add":
+        base = next((v for v in values if isinstance(v, datetime)), None)
+        total = sum(v for v in values if not isinstance(v, datetime))
+        return base + timedelta(milliseconds=total) if base else total
+    if op == "$ifNull":
+        return values[0] if values[0] is not None else values[1]
+    if op == "$max":
+        return max(values, key=_rank)
+    if op == "$min":
+        return min(values, key=_rank)
+    if op == "$mod":
+        return values[0] % values[1]
+    if op == "$and":
+        return all(values)
+    if op == "$or":
+        return any(values)
+    raise NotImplementedError(f"FakeMongo: expression {op}")
+
+def _apply_update(doc: dict, update, inserting: bool = False):
+    if isinstance(update, list):
+        for stage in update:
+            (op, fields), = stage.items()
+            assert op in ("$set", "$addFields"), op
+            computed = {k: _eval(v, doc) for k, v in fields.items()}
+            doc.update(computed)
+        return
+    for op, fields in update.items():
+        if op == "$set":
+            doc.update(fields)
+        elif op == "$inc":
+            for k, v in fields.items():
+                doc[k] = doc.get(k, 0) + v
+        elif op == "$setOnInsert":
+            if inserting:
+                doc.update(fields)
+        elif op == "$unset":
+            for k in fields:
+                doc.pop(k, None)
+        elif op == "$push":
+            for k, v in fields.items():
+                doc.setdefault(k, []).append(v)
+        else:
+            raise NotImplementedError(f"FakeMongo: update operator {op}")
+
+def _project(doc: dict, projection):
+    if not projection:
+        return dict(doc)
+    out = {k: doc[k] for k, v in projection.items() if v and k in doc}
+    if projection.get("_id", 1):
+        out["_id"] = doc.get("_id")
+    return out
+
+class FakeCursor:
+    def __init__(self, docs: list[dict]):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda d: _rank(d.get(field)), reverse=order < 0)
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def batch_size(self, _size: int):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+    async def to_list(self, length=None):
+        return list(self._docs if length is None else self._docs[:length])
+
+class FakeCollection:
+    def __init__(self, db: "FakeDatabase", name: str):
+        self.db = db
+        self.name = name
+        self.docs: list[dict] = []
+        self._ids = itertools.count(1)
+        # Fields with a single-key unique index; insert_one enforces them like Mongo does
+        self._unique: set[str] = set()
+
+    async def _op(self):
+        # Every call is one simulated round trip
+        self.db.ops += 1
+        if self.db.latency:
+            await asyncio.sleep(self.db.latency)
+
+    def _find(self, query):
+        return [d for d in self.docs if _matches(d, query or {})]
+
+    async def create_index(self, keys, **kwargs):
+        await self._op()
+        if kwargs.get("unique") and len(keys) == 1:
+            self._unique.add(keys[0][0])
+        return "_".join(f"{k}_{v}" for k, v in keys)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await self._op()
+        found = FakeCursor(self._find(query))
+        if sort:
+            found.sort(sort)
+        docs = await found.to_list(1)
+        return _project(docs[0], projection) if docs else None
+
+    def find(self, query=None, projection=None):
+        self.db.ops += 1
+        return FakeCursor([_project(d, projection) for d in self._find(query)])
+
+    async def insert_one(self, doc: dict):
+        await self._op()
+        for field in self._unique:
+            if field in doc and any(d.get(field) == doc[field] for d in self.docs):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: {doc[field]}")
+        doc.setdefault("_id", next(self._ids))
+        self.docs.append(dict(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: list[dict], ordered: bool = True):
+        await self._op()
+        for doc in docs:
+            doc.setdefault("_id", next(self._ids))
+            self.docs.append(dict(doc))
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs])
+
+    def _upsert(self, query: dict, update) -> dict:
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        if "_id" in doc and any(d["_id"] == doc["_id"] for d in self.docs):
+            # The filter did not match, but the _id is taken (e.g. a lease held by someone else)
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: {doc['_id']}")
+        doc["_id"] = doc.get("_id", next(self._ids))
+        _apply_update(doc, update, inserting=True)
+        self.docs.append(doc)
+        return doc
+
+    async def update_one(self, query, update, upsert: bool = False):
+        await self._op()
+        found = self._find(query)
+        if found:
+            before = dict(found[0])
+            _apply_update(found[0], update)
+            return SimpleNamespace(matched_count=1, modified_count=int(before != found[0]), upserted_id=None)
+        if upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._upsert(query, update)["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update, upsert: bool = False):
+        await self._op()
+        found = self._find(query)
+        modified = 0
+        for doc in found:
+            before = dict(doc)
+            _apply_update(doc, update)
+            modified += before != doc
+        return SimpleNamespace(matched_count=len(found), modified_count=modified, upserted_id=None)
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False, return_document=False):
+        await self._op()
+        found = FakeCursor(self._find(query))
+        if sort:
+            found.sort(sort)
+        docs = await found.to_list(1)
+        if not docs:
+            if upsert:
+                doc = self._upsert(query, update)
+                return _project(doc, projection) if return_document else None
+            return None
+        before = dict(docs[0])
+        _apply_update(docs[0], update)
+        return _project(docs[0] if return_document else before, projection)
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        await self._op()
+        matched = modified = upserted = 0
+        for req in requests:
+            name = type(req).__name__
+            if name == "InsertOne":
+                doc = req._doc
+                doc.setdefault("_id", next(self._ids))
+                self.docs.append(dict(doc))
+                continue
+            found = self._find(req._filter)
+            targets = found if name == "UpdateMany" else found[:1]
+            for doc in targets:
+                before = dict(doc)
+                _apply_update(doc, req._doc)
+                matched += 1
+                modified += before != doc
+            if not found and req._upsert:
+                self._upsert(req._filter, req._doc)
+                upserted += 1
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_count=upserted)
+
+    async def delete_one(self, query):
+        await self._op()
+        found = self._find(query)
+        if found:
+            self.docs.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        await self._op()
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def count_documents(self, query):
+        await self._op()
+        return len(self._find(query))
+
+    async def estimated_document_count(self):
+        await self._op()
+        return len(self.docs)
+
+    def aggregate(self, pipeline: list[dict]):
+        self.db.ops += 1
+        docs = [dict(d) for d in self.docs]
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == "$match":
+                docs = [d for d in docs if _matches(d, spec)]
+            elif op == "$group":
+                groups: dict = {}
+                for d in docs:
+                    key = _eval(spec["_id"], d)
+                    group = groups.setdefault(key, {"_id": key})
+                    for field, acc in spec.items():
+                        if field == "_id":
+                            continue
+                        (acc_op, acc_expr), = acc.items()
+                        assert acc_op == "$sum", acc_op
+                        group[field] = group.get(field, 0) + _eval(acc_expr, d)
+                docs = list(groups.values())
+            else:
+                raise NotImplementedError(f"FakeMongo: pipeline stage {op}")
+        return FakeCursor(docs)
+
+class FakeDatabase:
+    """Dict-of-collections database that counts every call as one Mongo round trip."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.ops = 0
+        self._collections: dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+
+# ---------------------------------------------------------------------------
+# Fake Telegram client and synthetic NewMessage events
+# ---------------------------------------------------------------------------
+
+class FakeMessage:
+    def __init__(self, client: "FakeTelegramClient", chat_id: int, text: str):
+        self.client = client
+        self.chat_id = chat_id
+        self.text = text
+        self.edits = 0
+
+    async def edit(self, text: str, **kwargs):
+        self.client.calls += 1
+        self.edits += 1
+        self.text = text
+        return self
+
+class FakeEvent:
+    def __init__(self, client: "FakeTelegramClient", sender_id: int, text: str, match):
+        self.client = client
+        self.sender_id = sender_id
+        self.chat_id = sender_id
+        self.id = 0
+        self.raw_text = self.text = text
+        self.pattern_match = match
+        self.message = SimpleNamespace(id=0, text=text, media=None, file=None)
+        self.replies: list[FakeMessage] = []
+
+    async def reply(self, text: str = "", **kwargs):
+        msg = await self.client.send_message(self.sender_id, text, **kwargs)
+        self.replies.append(msg)
+        return msg
+
+    async def respond(self, text: str = "", **kwargs):
+        return await self.reply(text, **kwargs)
+
+class FakeTelegramClient:
+    """Collects handlers registered with `client.on(...)` and feeds them synthetic messages."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.handlers: list = []
+        self.calls = 0
+        self.sent_files = 0
+
+    def on(self, builder):
+        def decorator(fn):
+            self.handlers.append((builder, fn))
+            return fn
+        return decorator
+
+    def add_event_handler(self, fn, builder=None):
+        self.handlers.append((builder, fn))
+
+    async def send_message(self, chat_id, text: str = "", **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeMessage(self, chat_id, text)
+
+    async def send_file(self, chat_id, file, caption: str = "", **kwargs):
+        self.calls += 1
+        self.sent_files += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeMessage(self, chat_id, caption)
+
+    async def get_me(self):
+        return SimpleNamespace(id=1, username="nexus_bench_bot")
+
+    async def dispatch(self, sender_id: int, text: str) -> FakeEvent | None:
+        """Runs every handler whose pattern matches `text`, like Telethon's NewMessage dispatch."""
+        last = None
+        for builder, fn in self.handlers:
+            pattern = getattr(builder, "pattern", None)
+            match = pattern(text) if pattern else re.match(r".*", text)
+            if not match:
+                continue
+            event = FakeEvent(self, sender_id, text, match)
+            await fn(event)
+            last = event
+        return last
@@ -0,0 +1,250 @@
+"""End-to-end load benchmark for the search path.
+
+Drives the real handlers from modules.user_handlers with synthetic /search messages from N
+concurrent users, against local stand-ins for the Nexus nodes, the pastebin, Mongo and Telegram
+(see bench/fakes.py). Nothing leaves the machine.
+
+    python -m bench.run_bench --users 200 --nodes 6 --lines 500 --json bench_output.json
+
+Reports p50/p95/p99 search latency, throughput, peak RSS and Mongo ops per search. `--json`
+writes the same numbers as machine-readable output so runs can be compared over time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Nexus bot search benchmark")
+    parser.add_argument("--users", type=int, default=50, help="concurrent users, one search each per round")
+    parser.add_argument("--rounds", type=int, default=1, help="searches per user (premium limit is 5/day)")
+    parser.add_argument("--nodes", type=int, default=6, help="number of fake Nexus nodes")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas per node/shard (NEXUS_SHARDS)")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged requests to a second replica")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of node searches with extra tail latency")
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="extra latency for tail searches (s)")
+    parser.add_argument("--latency", type=float, default=0.2, help="node time-to-first-byte (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="node latency jitter (s)")
+    parser.add_argument("--lines", type=int, default=200, help="result lines streamed per node")
+    parser.add_argument("--stream-time", type=float, default=0.1, help="time to stream all lines (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of node searches answering HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction of node searches that hang")
+    parser.add_argument("--node-timeout", type=float, default=5.0, help="SEARCH_NODE_TIMEOUT for the run (s)")
+    parser.add_argument("--budget", type=float, default=0.0, help="per-tier search time budget (s, 0 = node timeout)")
+    parser.add_argument("--shared-lines", type=int, default=0, help="leading lines identical on every node (duplicates)")
+    parser.add_argument("--paste-latency", type=float, default=0.05, help="fake pastebin latency (s)")
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="simulated Mongo round trip (s)")
+    parser.add_argument("--telegram-latency", type=float, default=0.01, help="simulated Telegram API call (s)")
+    parser.add_argument("--cancel-rate", type=float, default=0.0, help="fraction of searches cancelled with /cancel")
+    parser.add_argument("--cancel-after", type=float, default=0.1, help="seconds after /search to send /cancel")
+    parser.add_argument("--distinct-queries", type=int, default=0, help="number of distinct queries (0 = unique per search)")
+    parser.add_argument("--workers", type=int, default=0, help="run searches through the Mongo job queue with N in-process workers")
+    parser.add_argument("--worker-concurrency", type=int, default=5, help="jobs each worker runs at once")
+    parser.add_argument("--tier", choices=["free", "premium"], default="premium")
+    parser.add_argument("--no-cache", action="store_true", help="disable the result cache")
+    parser.add_argument("--no-merge", action="store_true", help="disable cross-node deduplication/grouping")
+    parser.add_argument("--paste-compression", choices=["auto", "gzip", "off"], default="off")
+    parser.add_argument("--paste-error-rate", type=float, default=0.0, help="fraction of paste uploads answering HTTP 503")
+    parser.add_argument("--file-threshold", type=int, default=4 * 1024 * 1024, help="results above this many bytes are sent as a file")
+    parser.add_argument("--paste-plain-only", action="store_true", help="fake pastebin rejects gzipped uploads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON to PATH ('-' for stdout)")
+    return parser.parse_args(argv)
+
+def configure_env(args):
+    """Points the bot's config at the fake services. Must run before any `modules` import."""
+    os.environ["NEXUS_API_URLS"] = ",".join(f"http://node-{i+1}.bench" for i in range(args.nodes))
+    if args.replicas > 1:
+        os.environ["NEXUS_SHARDS"] = json.dumps({
+            f"Shard-{i+1}": [f"http://node-{i+1}.bench"] + [f"http://node-{i+1}-r{r+1}.bench" for r in range(1, args.replicas)]
+            for i in range(args.nodes)
+        })
+    os.environ["SEARCH_HEDGE_ENABLED"] = "true" if args.hedge else "false"
+    os.environ["PASTEBIN_URL"] = "http://paste.bench"
+    os.environ["SEARCH_NODE_TIMEOUT"] = str(args.node_timeout)
+    os.environ["SEARCH_TOTAL_TIMEOUT"] = str(args.node_timeout * 1.1)
+    os.environ["RESULT_CACHE_DIR"] = ""
+    os.environ["ADMIN_ID"] = "1"
+    # Bench queries are short ("q7"), and budgets default to the node timeout unless --budget is given
+    os.environ["QUERY_MIN_LITERAL"] = "1"
+    os.environ["QUERY_BUDGET_FREE"] = os.environ["QUERY_BUDGET_PREMIUM"] = str(args.budget or args.node_timeout)
+    # Simulated users send back-to-back rounds; flood control would drop them
+    os.environ["FLOOD_RATE"] = "0"
+    os.environ["PASTEBIN_COMPRESSION"] = args.paste_compression
+    os.environ["PASTEBIN_RETRY_BACKOFF"] = "0.1"
+    os.environ["DELIVERY_FILE_THRESHOLD"] = str(args.file_threshold)
+    if args.workers:
+        os.environ["BOT_ROLE"] = "frontend"
+        os.environ["JOB_POLL_INTERVAL"] = "0.05"
+    if args.no_cache:
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+    if args.no_merge:
+        os.environ["SEARCH_MERGE_RESULTS"] = "false"
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def classify(text: str) -> str:
+    if text.startswith("✅"):
+        return "ok"
+    if text.startswith("❌"):
+        return "no_results"
+    if text.startswith("⚠️"):
+        return "error"
+    if text.startswith("⏳"):
+        return "rejected"
+    if text.startswith("🛑"):
+        return "cancelled"
+    return "other"
+
+async def run(args) -> dict:
+    from bench.fakes import FakeNexusTransport, FakeDatabase, FakeTelegramClient
+
+    # Swap Mongo for the in-memory stand-in before the handler modules bind the collections
+    import modules.database as database
+    fake_db = FakeDatabase(latency=args.mongo_latency)
+    database.db = fake_db
+    for attr in dir(database):
+        if attr.endswith("_col"):
+            setattr(database, attr, fake_db[getattr(database, attr).name])
+
+    from modules.http_client import init_http_client, close_http_client
+    from modules.user_handlers import register_user_handlers
+    from modules.router import router
+
+    transport = FakeNexusTransport(
+        latency=args.latency, jitter=args.jitter, lines=args.lines, stream_time=args.stream_time,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate, paste_latency=args.paste_latency,
+        seed=args.seed, shared_lines=args.shared_lines, paste_gzip=not args.paste_plain_only,
+        paste_error_rate=args.paste_error_rate, tail_rate=args.tail_rate, tail_latency=args.tail_latency
+    )
+    await init_http_client(transport=transport)
+    await database.warm_up_db()
+
+    now = datetime.utcnow()
+    for i in range(args.users):
+        await database.users_col.insert_one({
+            "user_id": 1000 + i,
+            "type": args.tier,
+            "premium_expiry": now + timedelta(days=30) if args.tier == "premium" else None,
+            "searches_today": 0,
+            "last_reset": now,
+            "referred_by": None,
+            "referral_count": 0,
+            "is_banned": False
+        })
+
+    client = FakeTelegramClient(latency=args.telegram_latency)
+    register_user_handlers(client)
+    router.attach(client)
+
+    if args.workers:
+        from modules.jobs import JobWorker
+        for i in range(args.workers):
+            asyncio.create_task(JobWorker(f"bench-worker-{i+1}", args.worker_concurrency).run())
+
+    latencies: list[float] = []
+    outcomes: dict[str, int] = {}
+    counter = iter(range(10**9))
+    cancel_random = random.Random(args.seed)
+
+    async def one_search(user_id: int):
+        n = next(counter)
+        query = f"q{n % args.distinct_queries}" if args.distinct_queries else f"q{n}"
+        started = time.perf_counter()
+        if cancel_random.random() < args.cancel_rate:
+            asyncio.get_running_loop().call_later(
+                args.cancel_after, lambda: asyncio.ensure_future(client.dispatch(user_id, "/cancel"))
+            )
+        event = await client.dispatch(user_id, f"/search {query}")
+        latencies.append(time.perf_counter() - started)
+        final = event.replies[-1].text if event and event.replies else ""
+        outcome = classify(final)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    ops_before = fake_db.ops
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(one_search(1000 + i) for i in range(args.users)))
+    wall = time.perf_counter() - started
+    searches = args.users * args.rounds
+
+    await close_http_client()
+    for task in asyncio.all_tasks() - {asyncio.current_task()}:
+        task.cancel()
+
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "revision": git_revision(),
+        "params": vars(args),
+        "searches": searches,
+        "wall_time_s": round(wall, 4),
+        "throughput_per_s": round(searches / wall, 3) if wall else 0.0,
+        "latency_s": {
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(max(latencies), 4) if latencies else 0.0
+        },
+        "outcomes": outcomes,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "mongo_ops_per_search": round((fake_db.ops - ops_before) / searches, 2) if searches else 0.0,
+        "telegram_calls_per_search": round(client.calls / searches, 2) if searches else 0.0,
+        "backend": {
+            "node_search_requests": transport.search_requests,
+            "lines_streamed": transport.lines_streamed,
+            "paste_requests": transport.paste_requests,
+            "paste_bytes": transport.paste_bytes,
+            "paste_failures": transport.paste_failures,
+            "files_sent": client.sent_files,
+            "deadline_stops": transport.deadline_stops
+        }
+    }
+
+def print_summary(result: dict):
+    lat = result["latency_s"]
+    print(f"Searches: {result['searches']} in {result['wall_time_s']}s ({result['throughput_per_s']}/s)")
+    print(f"Latency: p50={lat['p50']}s p95={lat['p95']}s p99={lat['p99']}s max={lat['max']}s")
+    print(f"Outcomes: {result['outcomes']}")
+    print(f"Peak RSS: {result['peak_rss_mb']} MB | Mongo ops/search: {result['mongo_ops_per_search']} | "
+          f"Telegram calls/search: {result['telegram_calls_per_search']}")
+    print(f"Backend: {result['backend']}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_env(args)
+    result = asyncio.run(run(args))
+    if args.json == "-":
+        json.dump(result, sys.stdout, indent=2, default=str)
+        print()
+        return
+    print_summary(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
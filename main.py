@@ -1,11 +1,25 @@
 import logging
 import asyncio
+import signal
 from telethon import TelegramClient
-from modules.config import API_ID, API_HASH, BOT_TOKEN
-from modules.database import init_db
+from telethon.sessions import StringSession
+from modules.config import (
+    API_ID, API_HASH, BOT_TOKEN, BOT_ROLE, JOB_QUEUE_ENABLED, WORKER_ID, JOB_WORKER_CONCURRENCY,
+    LEADER_LEASE_SECONDS, SHUTDOWN_DRAIN_TIMEOUT
+)
+from modules.database import init_db, warm_up_db, stats_writer
+from modules.http_client import init_http_client, close_http_client
+from modules.health import run_health_monitor
+from modules.metrics import start_metrics_server
 from modules.user_handlers import register_user_handlers
 from modules.admin_handlers import register_admin_handlers
 from modules.help import register_help_handlers
+from modules.router import router
+from modules.lifecycle import lifecycle, get_bot_username
+from modules.expiry import ExpiryScheduler
+from modules.broadcast import watch_broadcasts
+from modules.jobs import JobWorker
+from modules.leader import LeaderElection
 
 # Configure logging
 logging.basicConfig(
@@ -15,22 +29,108 @@ logging.basicConfig(
 )
 logger = logging.getLogger("bot_main")
 
+def singleton_tasks(client: TelegramClient) -> list[asyncio.Task]:
+    """Background tasks that must run in exactly one process; started by the leader in cluster mode."""
+    return [
+        asyncio.create_task(ExpiryScheduler(client).run()),
+        asyncio.create_task(watch_broadcasts(client))
+    ]
+
+async def warm_up(client: TelegramClient):
+    """Start-up work the bot doesn't need before it can take commands."""
+    results = await asyncio.gather(warm_up_db(), get_bot_username(client), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Warm-up step failed: {result}")
+
 async def main():
-    # Initialize Database
-    await init_db()
-    
-    # Initialize Telethon Client
-    client = TelegramClient('bot_session', API_ID, API_HASH)
-    await client.start(bot_token=BOT_TOKEN)
-    logger.info("Bot is running...")
-
-    # Register modular handlers
-    register_user_handlers(client)
-    register_admin_handlers(client)
-    register_help_handlers(client)
-
-    # Run until disconnected
-    await client.run_until_disconnected()
+    # Initialize Telethon Client. Workers only send (reminders, broadcasts), so they never take
+    # updates away from the frontend's session, and keep their session in memory: WORKER_ID changes on
+    # every restart by default, so a session file per worker would pile up in the working directory.
+    if BOT_ROLE == "worker":
+        client = TelegramClient(StringSession(), API_ID, API_HASH, receive_updates=False)
+    else:
+        client = TelegramClient('bot_session', API_ID, API_HASH)
+
+    # Mongo, the Telegram login and the shared HTTP pool (Nexus and pastebin traffic) come up concurrently
+    await asyncio.gather(init_db(), client.start(bot_token=BOT_TOKEN), init_http_client())
+
+    # Index builds, the stats cache and the bot's identity are filled in the background
+    warmup_task = asyncio.create_task(warm_up(client))
+    # Keep the node health table warm so searches never probe the cluster inline
+    health_task = asyncio.create_task(run_health_monitor())
+    # Write-behind flusher for global stats counters
+    stats_task = asyncio.create_task(stats_writer.run())
+    # Local Prometheus endpoint for per-stage latency metrics
+    metrics_server = await start_metrics_server()
+
+    # Cluster mode: one process at a time runs the singleton background tasks
+    leader_task = None
+    if JOB_QUEUE_ENABLED:
+        election = LeaderElection("singletons", WORKER_ID, LEADER_LEASE_SECONDS, lambda: singleton_tasks(client))
+        leader_task = asyncio.create_task(election.run())
+
+    # SIGTERM/SIGINT start a graceful drain instead of killing in-flight searches
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+
+    worker = None
+    if BOT_ROLE == "worker":
+        logger.info(f"Search worker {WORKER_ID} is running...")
+        worker = JobWorker(WORKER_ID, JOB_WORKER_CONCURRENCY)
+        serve_task = asyncio.create_task(worker.run())
+    else:
+        logger.info("Bot is running...")
+
+        # Register modular handlers
+        register_user_handlers(client)
+        register_admin_handlers(client)
+        register_help_handlers(client)
+        # One NewMessage handler parses each command and dispatches it through the routing table
+        router.attach(client)
+
+        # Run until disconnected
+        serve_task = asyncio.create_task(client.run_until_disconnected())
+
+    stop_task = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({serve_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        if serve_task.done():
+            # Disconnected or crashed on its own; surface the error if there was one
+            serve_task.result()
+        else:
+            logger.info(f"Shutdown requested, draining for up to {SHUTDOWN_DRAIN_TIMEOUT:g}s...")
+            if worker:
+                await worker.drain(SHUTDOWN_DRAIN_TIMEOUT)
+                # Anything still running is handed back to the queue
+                serve_task.cancel()
+            else:
+                # New searches are refused from here on; the client stays connected so running ones can reply
+                await lifecycle.drain(SHUTDOWN_DRAIN_TIMEOUT)
+                await client.disconnect()
+            await asyncio.gather(serve_task, return_exceptions=True)
+    finally:
+        stop_task.cancel()
+        warmup_task.cancel()
+        if leader_task:
+            leader_task.cancel()
+            # Let the election release the lease so another process takes over at once
+            await asyncio.gather(leader_task, return_exceptions=True)
+        health_task.cancel()
+        stats_task.cancel()
+        # Wait for the final flush so no buffered counters are lost
+        await asyncio.gather(stats_task, return_exceptions=True)
+        if metrics_server:
+            metrics_server.close()
+        await close_http_client()
+        if client.is_connected():
+            await client.disconnect()
+        logger.info("Shutdown complete")
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,91 +1,171 @@
 import asyncio
-import uuid
-from telethon import events, TelegramClient
+import io
+import re
+from telethon import TelegramClient
 from telethon.tl.custom import Message
-from modules.config import ADMIN_ID
-from modules.database import keys_col, users_col
+from modules.config import JOB_QUEUE_ENABLED, GENKEY_MAX_BATCH, BULK_MAX_IDS, BULK_MAX_FILE_BYTES
+from modules.database import create_keys, set_banned
+from modules.router import router
+from modules.broadcast import start_broadcast, resume_broadcast, cancel_broadcast, get_active_broadcast
+from modules.metrics import (
+    SEARCH_STAGE_SECONDS, SEARCHES_TOTAL, NODE_REQUEST_SECONDS, NODE_LINES_TOTAL,
+    NODE_ERRORS_TOTAL, DB_CALL_SECONDS
+)
 
-def register_admin_handlers(client: TelegramClient):
+def _is_text_file(message: Message | None) -> bool:
+    """True for a text/* or .txt document; photos, stickers, voice notes and other media are ignored."""
+    file = message.file if message else None
+    if file is None:
+        return False
+    return (file.mime_type or "").startswith("text/") or (file.name or "").lower().endswith(".txt")
 
-    @client.on(events.NewMessage(pattern=r'^/genkey (\d+)'))
-    async def genkey_cmd(event: Message):
-        if event.sender_id != ADMIN_ID:
-            return
-            
-        days = int(event.pattern_match.group(1))
-        new_key = f"NEXUS-{str(uuid.uuid4()).upper()[:8]}"
-        
-        await keys_col.insert_one({
-            "key_string": new_key,
-            "duration_days": days,
-            "is_used": False
-        })
-        
-        await event.reply(f"✅ Key generated for {days} days:\n\n`{new_key}`")
-
-    @client.on(events.NewMessage(pattern=r'^/ban (\d+)'))
-    async def ban_cmd(event: Message):
-        if event.sender_id != ADMIN_ID:
-            return
-            
-        target_id = int(event.pattern_match.group(1))
-        result = await users_col.update_one({"user_id": target_id}, {"$set": {"is_banned": True}})
-        
-        if result.modified_count > 0:
-            await event.reply(f"✅ User {target_id} has been banned.")
-        else:
-            await event.reply("❌ User not found in database.")
+async def _collect_user_ids(event: Message, args: str) -> tuple[list[int], int]:
+    """User IDs from the command text plus a .txt document attached to, or replied to by, the command.
 
-    @client.on(events.NewMessage(pattern=r'^/unban (\d+)'))
-    async def unban_cmd(event: Message):
-        if event.sender_id != ADMIN_ID:
-            return
-            
-        target_id = int(event.pattern_match.group(1))
-        result = await users_col.update_one({"user_id": target_id}, {"$set": {"is_banned": False}})
-        
-        if result.modified_count > 0:
-            await event.reply(f"✅ User {target_id} has been unbanned.")
+    IDs may be separated by whitespace, commas or semicolons. Returns (unique IDs in order, number of
+    invalid entries skipped). Raises ValueError when the input is too large.
+    """
+    text = args
+    source = event.message if _is_text_file(event.message) else None
+    if source is None and event.is_reply:
+        reply = await event.get_reply_message()
+        if _is_text_file(reply):
+            source = reply
+    if source is not None:
+        if source.file.size > BULK_MAX_FILE_BYTES:
+            raise ValueError(f"The file is too large (max {BULK_MAX_FILE_BYTES // 1024} KB).")
+        data = await source.download_media(file=bytes)
+        text += "\n" + data.decode("utf-8", errors="replace")
+
+    user_ids: dict[int, None] = {}
+    invalid = 0
+    for token in re.split(r"[\s,;]+", text):
+        if not token:
+            continue
+        if token.isdigit():
+            user_ids[int(token)] = None
         else:
-            await event.reply("❌ User not found in database.")
+            invalid += 1
+    if len(user_ids) > BULK_MAX_IDS:
+        raise ValueError(f"Too many IDs ({len(user_ids)}); the limit is {BULK_MAX_IDS} per command.")
+    return list(user_ids), invalid
 
-    @client.on(events.NewMessage(pattern=r'^/broadcast ([\s\S]+)'))
-    async def broadcast_cmd(event: Message):
-        if event.sender_id != ADMIN_ID:
-            return
-            
-        message_text = event.pattern_match.group(1)
-        users = await users_col.find({}).to_list(length=None)
-        total_users = len(users)
-        
-        if total_users == 0:
+def register_admin_handlers(client: TelegramClient):
+
+    # Pick up a broadcast interrupted by a restart (in cluster mode the leader's watchdog does this)
+    if not JOB_QUEUE_ENABLED:
+        asyncio.create_task(resume_broadcast(client))
+
+    @router.command("genkey", args=r"\d+(?:\s+\d+)?", admin=True, usage="/genkey <days> [count]")
+    async def genkey_cmd(event: Message, args: str, user: None):
+        parts = args.split()
+        days, count = int(parts[0]), int(parts[1]) if len(parts) > 1 else 1
+        if not 1 <= count <= GENKEY_MAX_BATCH:
+            return await event.reply(f"❌ You can generate between 1 and {GENKEY_MAX_BATCH} keys at once.")
+
+        keys = await create_keys(count, days)
+        if count == 1:
+            return await event.reply(f"✅ Key generated for {days} days:\n\n`{keys[0]}`")
+
+        # Batches go out as a file rather than a wall of text
+        buffer = io.BytesIO("\n".join(keys).encode() + b"\n")
+        buffer.name = f"nexus_keys_{count}x{days}d.txt"
+        await client.send_file(
+            event.chat_id,
+            buffer,
+            caption=f"✅ Generated {count} keys valid for {days} days.",
+            reply_to=event.id,
+            force_document=True
+        )
+
+    async def set_banned_cmd(event: Message, args: str, banned: bool):
+        verb = "banned" if banned else "unbanned"
+        try:
+            user_ids, invalid = await _collect_user_ids(event, args)
+        except ValueError as e:
+            return await event.reply(f"❌ {e}")
+        if not user_ids:
+            command = "ban" if banned else "unban"
+            return await event.reply(
+                f"ℹ️ Usage: `/{command} <user_id> [more IDs...]`, or send/reply to a .txt file of IDs with `/{command}`."
+            )
+
+        matched, modified = await set_banned(user_ids, banned)
+
+        if len(user_ids) == 1 and not invalid:
+            if matched:
+                return await event.reply(f"✅ User {user_ids[0]} has been {verb}.")
+            return await event.reply("❌ User not found in database.")
+
+        msg = (
+            f"✅ {verb.capitalize()} {modified} user(s).\n\n"
+            f"🔹 **Matched:** {matched}\n"
+            f"🔸 **Missing:** {len(user_ids) - matched}"
+        )
+        if matched > modified:
+            msg += f"\n▫️ **Already {verb}:** {matched - modified}"
+        if invalid:
+            msg += f"\n⚠️ **Skipped invalid entries:** {invalid}"
+        await event.reply(msg)
+
+    @router.command("ban", args=r"[\d\s,;]*", admin=True, usage="/ban <user_id> [more IDs...]")
+    async def ban_cmd(event: Message, args: str, user: None):
+        await set_banned_cmd(event, args, True)
+
+    @router.command("unban", args=r"[\d\s,;]*", admin=True, usage="/unban <user_id> [more IDs...]")
+    async def unban_cmd(event: Message, args: str, user: None):
+        await set_banned_cmd(event, args, False)
+
+    @router.command("broadcast", args=r".+", admin=True, usage="/broadcast <message>")
+    async def broadcast_cmd(event: Message, args: str, user: None):
+        message_text = args
+        if get_active_broadcast():
+            return await event.reply("⚠️ A broadcast is already running. Use `/bcstatus` or `/bccancel`.")
+
+        broadcast = await start_broadcast(client, message_text)
+        if not broadcast:
             return await event.reply("❌ No users to broadcast to.")
             
-        # Spread broadcast dynamically to avoid rate limits
-        await event.reply(f"📣 Starting broadcast to {total_users} users. Sending at a safe rate of ~1 message per 1.5s to avoid flood limits.")
-        
-        stats = {"success": 0}
-        
-        # Background task
-        async def run_broadcast():
-            for i, user in enumerate(users):
-                try:
-                    await client.send_message(user['user_id'], message_text)
-                    stats["success"] += 1
-                except Exception:
-                    pass
-                
-                # Sleep briefly between every message 
-                await asyncio.sleep(1.5)
-                
-                # Take a slightly longer pause every 50 messages to appease Telegram's flood limits
-                if (i + 1) % 50 == 0:
-                    await asyncio.sleep(10)
-                
-            try:
-                await client.send_message(ADMIN_ID, f"✅ Broadcast finished. Reached {stats['success']}/{total_users} users.")
-            except:
-                pass
-
-        # Dispatch task to not block the admin's current session loop
-        asyncio.create_task(run_broadcast())
\ No newline at end of file
+        # Users are streamed from a cursor and sent through an adaptive rate limiter in the background
+        broadcast.progress_msg = await event.reply(
+            f"📣 Starting broadcast to ~{broadcast.total} users. "
+            f"Progress is saved as it goes and resumes automatically after a restart."
+        )
+
+    @router.command("bcstatus", admin=True)
+    async def bcstatus_cmd(event: Message, args: str, user: None):
+        broadcast = get_active_broadcast()
+        if not broadcast:
+            return await event.reply("ℹ️ No broadcast is running.")
+        await event.reply(broadcast.progress_text())
+
+    @router.command("bccancel", admin=True)
+    async def bccancel_cmd(event: Message, args: str, user: None):
+        if cancel_broadcast():
+            await event.reply("🛑 Cancelling broadcast. In-flight messages will finish first.")
+        else:
+            await event.reply("ℹ️ No broadcast is running.")
+
+    @router.command("metrics", admin=True)
+    async def metrics_cmd(event: Message, args: str, user: None):
+        def fmt(histogram, **labels):
+            count, mean, p95 = histogram.summary(**labels)
+            return f"n={count} avg={mean:.2f}s p95≤{p95:g}s"
+
+        msg = "📈 **Search Metrics**\n\n**Stages:**\n"
+        for stage in ("queue", "status", "fetch", "paste", "total"):
+            msg += f"🔹 `{stage}`: {fmt(SEARCH_STAGE_SECONDS, stage=stage)}\n"
+
+        outcomes = ", ".join(f"{key[0]}={int(value)}" for key, value in sorted(SEARCHES_TOTAL.values.items()))
+        msg += f"\n**Outcomes:** {outcomes or 'none yet'}\n"
+
+        msg += "\n**Nodes:**\n"
+        for (node,) in sorted(NODE_REQUEST_SECONDS.values):
+            errors = sum(v for (n, _), v in NODE_ERRORS_TOTAL.values.items() if n == node)
+            msg += f"🔸 `{node}`: {fmt(NODE_REQUEST_SECONDS, node=node)} lines={int(NODE_LINES_TOTAL.get(node=node))} errors={int(errors)}\n"
+
+        msg += "\n**Database:**\n"
+        for (op,) in sorted(DB_CALL_SECONDS.values):
+            msg += f"▫️ `{op}`: {fmt(DB_CALL_SECONDS, op=op)}\n"
+
+        await event.reply(msg)
\ No newline at end of file
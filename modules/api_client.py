@@ -1,94 +1,558 @@
 import httpx
+import asyncio
+import codecs
+import io
 import logging
 import json
-from modules.config import NEXUS_API_URLS, NEXUS_API_KEY, PASTEBIN_URL
+import tempfile
+import time
+import zlib
+from contextlib import AsyncExitStack
+from modules.http_client import get_http_client, host_slot
+from modules.health import NodeHealth, Shard, shards, get_cluster_status
+from modules.metrics import (
+    NODE_REQUEST_SECONDS, NODE_LINES_TOTAL, NODE_BYTES_TOTAL, NODE_ERRORS_TOTAL, HEDGED_REQUESTS_TOTAL
+)
+from modules.config import (
+    NEXUS_API_KEY, PASTEBIN_URL, SEARCH_HEDGE_ENABLED, HEDGE_MIN_DELAY,
+    SEARCH_FANOUT_MODE, SEARCH_NODE_TIMEOUT, SEARCH_TOTAL_TIMEOUT, SEARCH_SPOOL_MEMORY,
+    SEARCH_MERGE_RESULTS, SEARCH_DEDUP_MAX_HASHES, PASTEBIN_COMPRESSION,
+    PASTEBIN_TIMEOUT, PASTEBIN_RETRIES, PASTEBIN_RETRY_BACKOFF
+)
 
 logger = logging.getLogger("api_client")
 
+# Segment key for error lines, which are always written after every node's hits
+_ERRORS = "errors"
+
+class SearchResult:
+    """Bounded sink for streamed result lines.
+
+    Lines go into spooled temporary buffers that move to disk past their share of SEARCH_SPOOL_MEMORY,
+    so memory stays flat however large the result is. Once the line or byte cap is reached
+    further lines are dropped and `truncated` is set.
+
+    With `merge` enabled each shard streams into its own segment, so ripgrep's per-file runs are never
+    interleaved with other shards' output, error lines are collected at the end, and identical hits
+    returned by several nodes are kept once (each hash remembers the source that sent it first, bounded
+    by SEARCH_DEDUP_MAX_HASHES); repeats within one node's own output are kept.
+    """
+
+    def __init__(self, max_lines: int = 0, max_bytes: int = 0, buffer=None, merge: bool = False):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.merge = merge
+        # segment key -> [buffer, bytes written]; iterated in insertion order with errors last
+        self._segments: dict = {}
+        if buffer is not None:
+            self._segments[None] = [buffer, 0]
+        # line hash -> source that sent it first
+        self._seen: dict[int, object] = {}
+        self._files: set[int] = set()
+        self.line_count = 0
+        self.bytes = 0
+        self.errors: list[str] = []
+        self.duplicates = 0
+        self.file_count = 0
+        # Hits written per source (shard index), for progress reporting
+        self.source_hits: dict = {}
+        self.truncated = False
+        # Set when the overall search deadline cancelled shards that were still streaming
+        self.deadline_exceeded = False
+        # Set when the caller's time budget (tighter than the cluster deadlines) stopped the search
+        self.over_budget = False
+        # Seconds the backend fetch took (0 for cached results)
+        self.elapsed = 0.0
+
+    @classmethod
+    def from_bytes(cls, payload: bytes, line_count: int, errors: list[str] = None, file_count: int = 0,
+                   truncated: bool = False) -> "SearchResult":
+        """Rebuilds a result around an already serialized payload (used by the result cache)."""
+        result = cls(buffer=io.BytesIO(payload))
+        result._segments[None][1] = len(payload)
+        result.line_count = line_count
+        result.bytes = len(payload)
+        result.errors = list(errors or [])
+        result.file_count = file_count
+        result.truncated = truncated
+        return result
+
+    def __len__(self) -> int:
+        return self.line_count
+
+    @property
+    def full(self) -> bool:
+        return bool(
+            (self.max_lines and self.line_count >= self.max_lines)
+            or (self.max_bytes and self.bytes >= self.max_bytes)
+        )
+
+    @property
+    def hit_count(self) -> int:
+        return self.line_count - len(self.errors)
+
+    def _segment(self, source) -> list:
+        key = source if self.merge else None
+        segment = self._segments.get(key)
+        if segment is None:
+            spool = SEARCH_SPOOL_MEMORY // max(1, len(shards)) if self.merge else SEARCH_SPOOL_MEMORY
+            segment = self._segments[key] = [tempfile.SpooledTemporaryFile(max_size=spool, mode="w+b"), 0]
+        return segment
+
+    def _write(self, line: str, source=None):
+        segment = self._segment(source)
+        data = line.encode("utf-8", errors="replace")
+        if segment[1]:
+            data = b"\n" + data
+        segment[0].seek(0, io.SEEK_END)
+        segment[0].write(data)
+        segment[1] += len(data)
+        self.bytes += len(data)
+        self.line_count += 1
+
+    def _is_duplicate(self, line: str, source) -> bool:
+        digest = hash(line)
+        first = self._seen.get(digest, source)
+        if first != source:
+            self.duplicates += 1
+            return True
+        if digest not in self._seen and len(self._seen) < SEARCH_DEDUP_MAX_HASHES:
+            self._seen[digest] = source
+        # Count distinct source files (ripgrep prints "path:line:match") under the same bound
+        path, sep, _ = line.partition(":")
+        if sep and len(self._files) < SEARCH_DEDUP_MAX_HASHES:
+            self._files.add(hash(path))
+            self.file_count = len(self._files)
+        return False
+
+    def add(self, line: str, source=None) -> bool:
+        """Appends a result line. Returns False once the caps are reached and the line was dropped."""
+        if self.full:
+            self.truncated = True
+            return False
+        if self.merge and self._is_duplicate(line, source):
+            return True
+        self._write(line, source)
+        if source is not None:
+            self.source_hits[source] = self.source_hits.get(source, 0) + 1
+        return True
+
+    def add_error(self, line: str):
+        """Error lines are always kept so failures are visible even in a truncated result."""
+        self.errors.append(line)
+        self._write(line, _ERRORS)
+
+    def iter_bytes(self, chunk_size: int = 64 * 1024):
+        """Yields the payload from the start. Safe to interleave with other readers of the same result."""
+        order = [key for key in self._segments if key != _ERRORS]
+        if _ERRORS in self._segments:
+            order.append(_ERRORS)
+        started = False
+        for key in order:
+            buffer, size = self._segments[key]
+            if not size:
+                continue
+            if started:
+                yield b"\n"
+            started = True
+            pos = 0
+            while pos < size:
+                buffer.seek(pos)
+                chunk = buffer.read(min(chunk_size, size - pos))
+                if not chunk:
+                    break
+                pos += len(chunk)
+                yield chunk
+
+    def iter_text(self, chunk_size: int = 64 * 1024):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for chunk in self.iter_bytes(chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.iter_bytes())
+
+    def close(self):
+        for buffer, _ in self._segments.values():
+            buffer.close()
+
+class SearchProgress:
+    """Per-shard state of a running search (pending, done, failed, timeout, skipped), reported to `on_change`."""
+
+    def __init__(self, results: SearchResult, on_change=None):
+        self.results = results
+        self.on_change = on_change
+        self.states = {shard.index: "pending" for shard in shards}
+
+    def set(self, shard: Shard, state: str):
+        self.states[shard.index] = state
+        if self.on_change:
+            try:
+                self.on_change(self)
+            except Exception as e:
+                logger.debug(f"Progress callback failed: {e}")
+
+    def hits(self, shard: Shard) -> int:
+        return self.results.source_hits.get(shard.index, 0)
+
+    def snapshot(self) -> list:
+        """[name, state, hits] per shard, in shard order (plain lists so it can be stored in a job document)."""
+        return [[shard.name, self.states[shard.index], self.hits(shard)] for shard in shards]
+
 async def check_api_status() -> tuple[bool, str]:
-    """Returns (is_ready, message). Checks all backend URLs to ensure cluster is ready."""
+    """Returns (is_ready, message) from the background health monitor's cached node table."""
     try:
-        async with httpx.AsyncClient() as client:
-            for i, url in enumerate(NEXUS_API_URLS):
-                try:
-                    res = await client.get(
-                        f"{url}/status",
-                        headers={"x-api-key": NEXUS_API_KEY},
-                        timeout=5.0
-                    )
-                    if res.status_code == 200:
-                        data = res.json()
-                        if data.get("state") != "done":
-                            return False, f"Node-{i+1} is not ready. State: {data.get('state')}"
-                    else:
-                        return False, f"Node-{i+1} returned HTTP {res.status_code}"
-                except Exception as e:
-                    return False, f"Node-{i+1} is unreachable: {e}"
-        return True, "All API nodes are ready."
+        return await get_cluster_status()
     except Exception as e:
         logger.error(f"Cluster Check Error: {e}")
         return False, "Cluster is currently unreachable."
 
-async def fetch_search_results(query: str, limit: int = 10) -> list[str]:
-    """Streams the ripgrep results from all backend nodes."""
-    results = []
+class _ShardFailed(Exception):
+    """Raised when no replica of a shard answered the search; the message is the user-facing error line."""
+
+async def _open_stream(client: httpx.AsyncClient, node: NodeHealth, query: str, limit: int, deadline: float | None):
+    """Opens a search stream on one replica. Its in-flight slots stay held until the returned stack is closed.
+
+    With a `deadline` (monotonic time) the node is told how many seconds are left, so it can stop
+    ripgrep when the budget runs out instead of running on after the bot has stopped listening.
+    """
+    stack = AsyncExitStack()
+    started = time.perf_counter()
+    try:
+        await stack.enter_async_context(node.slots)
+        await stack.enter_async_context(host_slot(node.url))
+        params = {"search": query, "limit": limit}
+        if deadline is not None:
+            params["deadline"] = f"{max(0.0, deadline - time.monotonic()):.1f}"
+        response = await stack.enter_async_context(client.stream(
+            "GET",
+            f"{node.url}/search",
+            params=params,
+            headers={"x-api-key": NEXUS_API_KEY},
+            timeout=SEARCH_NODE_TIMEOUT
+        ))
+        node.record_latency(time.perf_counter() - started)
+        return response, stack
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            # Lost a hedge race or hit a deadline: the time waited is only a lower bound on this replica's
+            # latency, so it is recorded only when it exceeds the current estimate. Recording shorter waits
+            # would make a replica that keeps losing hedges look faster than it is.
+            waited = time.perf_counter() - started
+            if node.ewma_latency is not None and waited > node.ewma_latency:
+                node.record_latency(waited)
+        await stack.aclose()
+        raise
+
+def _next_replica(backups: list[NodeHealth]):
+    while backups:
+        node = backups.pop(0)
+        if node.breaker.allow_request():
+            return node
+    return None
+
+def _record_open_failure(node: NodeHealth, kind: str):
+    node.breaker.record_failure()
+    node.record_outcome(False)
+    NODE_ERRORS_TOTAL.inc(node=node.name, kind=kind)
+
+async def _open_shard(client: httpx.AsyncClient, shard: Shard, primary: NodeHealth, backups: list[NodeHealth],
+                      query: str, limit: int, deadline: float | None):
+    """Opens the shard's search stream, returning (node, response, stack) for the first replica to answer HTTP 200.
+
+    With SEARCH_HEDGE_ENABLED the next replica is raced once `primary` has not answered within its recent p95.
+    A replica that fails is replaced by the next one. Raises _ShardFailed when every replica failed.
+    """
+    attempts: dict[asyncio.Task, NodeHealth] = {}
+
+    def launch(node: NodeHealth) -> asyncio.Task:
+        task = asyncio.create_task(_open_stream(client, node, query, limit, deadline))
+        attempts[task] = node
+        return task
+
+    pending = {launch(primary)}
+    hedge_after = primary.p95() if SEARCH_HEDGE_ENABLED and backups else None
+    hedged = False
+    winner = None
+    message = f"Failed to reach {shard.name}: no replica answered"
+    try:
+        while pending and winner is None:
+            timeout = max(HEDGE_MIN_DELAY, hedge_after) if hedge_after is not None and not hedged else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # The first replica is slower than usual; race the next one against it
+                hedged = True
+                node = _next_replica(backups)
+                if node:
+                    pending.add(launch(node))
+                continue
+            for task in done:
+                node = attempts[task]
+                if task.exception() is not None:
+                    err = task.exception()
+                    _record_open_failure(node, "exception")
+                    message = f"Failed to reach {node.name}: {type(err).__name__} {str(err)}"
+                    continue
+                response, stack = task.result()
+                if response.status_code == 200 and winner is None:
+                    winner = (node, response, stack)
+                    continue
+                await stack.aclose()
+                if response.status_code == 200:
+                    node.breaker.release_trial()
+                else:
+                    _record_open_failure(node, "http")
+                    message = f"Error from {node.name}: HTTP {response.status_code}"
+            if winner is None and not pending:
+                # Fail over to the next replica
+                node = _next_replica(backups)
+                if node:
+                    pending.add(launch(node))
+    finally:
+        for task in pending:
+            task.cancel()
+        for task, outcome in zip(pending, await asyncio.gather(*pending, return_exceptions=True)):
+            attempts[task].breaker.release_trial()
+            if isinstance(outcome, tuple):
+                await outcome[1].aclose()
+        if hedged:
+            label = "none" if winner is None else ("primary" if winner[0] is primary else "hedge")
+            HEDGED_REQUESTS_TOTAL.inc(shard=shard.name, winner=label)
+    if winner is None:
+        raise _ShardFailed(message)
+    return winner
+
+async def _stream_shard(client: httpx.AsyncClient, shard: Shard, primary: NodeHealth, backups: list[NodeHealth],
+                        query: str, limit: int, deadline: float | None, results: SearchResult, active: list):
+    """Streams one shard's ripgrep output into the shared result sink as lines arrive.
+
+    `active[0]` is kept pointing at the replica currently serving the shard, for the caller's error accounting.
+    """
+    node, response, stack = await _open_shard(client, shard, primary, backups, query, limit, deadline)
+    active[0] = node
+    lines = received = 0
+    try:
+        async for chunk in response.aiter_lines():
+            received += len(chunk) + 1
+            text = chunk.strip()
+            if text:
+                if text.startswith('{"error":'):
+                    try:
+                        err = json.loads(text)
+                        NODE_ERRORS_TOTAL.inc(node=node.name, kind="backend")
+                        results.add_error(f"Backend Error ({node.name}): {err['error']}")
+                        continue
+                    except:
+                        pass
+                lines += 1
+                if not results.add(text, source=shard.index):
+                    # Tier cap reached; stop pulling more data from this shard
+                    break
+    finally:
+        await stack.aclose()
+        # Counted locally and published once per stream to keep the per-line path cheap
+        NODE_LINES_TOTAL.inc(lines, node=node.name)
+        NODE_BYTES_TOTAL.inc(received, node=node.name)
+
+async def _query_shard(client: httpx.AsyncClient, shard: Shard, query: str, limit: int, deadline: float | None,
+                       results: SearchResult, progress: SearchProgress):
+    """Runs a single shard query on its best replica under the per-shard deadline, recording failures as result lines.
+
+    The per-shard deadline is SEARCH_NODE_TIMEOUT, or whatever is left of the caller's budget if that is sooner.
+    """
+    replicas = shard.ranked()
+    primary = _next_replica(replicas)
+    if primary is None:
+        # Fast-fail shards whose replicas the health monitor has marked as down instead of waiting on them
+        for node in shard.replicas:
+            NODE_ERRORS_TOTAL.inc(node=node.name, kind="skipped")
+        results.add_error(f"Failed to reach {shard.name}: skipped, node is unavailable")
+        progress.set(shard, "skipped")
+        return
+    active = [primary]
+    started = time.perf_counter()
+    timeout = SEARCH_NODE_TIMEOUT
+    budget_bound = deadline is not None and deadline - time.monotonic() < timeout
+    if budget_bound:
+        timeout = max(0.0, deadline - time.monotonic())
+    try:
+        await asyncio.wait_for(
+            _stream_shard(client, shard, primary, replicas, query, limit, deadline, results, active),
+            timeout=timeout
+        )
+        active[0].breaker.record_success()
+        active[0].record_outcome(True)
+        progress.set(shard, "done")
+    except _ShardFailed as failed:
+        results.add_error(str(failed))
+        progress.set(shard, "failed")
+    except asyncio.TimeoutError:
+        if budget_bound:
+            # The query outran its tier budget; that says nothing about the replica's health
+            results.over_budget = True
+            active[0].breaker.release_trial()
+            NODE_ERRORS_TOTAL.inc(node=active[0].name, kind="budget")
+            results.add_error(f"{shard.name}: stopped at your search time budget")
+            progress.set(shard, "timeout")
+            return
+        _record_open_failure(active[0], "timeout")
+        results.add_error(f"Failed to reach {shard.name}: timed out after {SEARCH_NODE_TIMEOUT:g}s")
+        progress.set(shard, "timeout")
+    except asyncio.CancelledError:
+        if results.deadline_exceeded and not results.over_budget:
+            # The overall search deadline ran out while this shard was still streaming
+            _record_open_failure(active[0], "timeout")
+        else:
+            # Cancelled by the user (/cancel): says nothing about the replica's health
+            active[0].breaker.release_trial()
+        raise
+    except Exception as node_err:
+        _record_open_failure(active[0], "exception")
+        err_name = type(node_err).__name__
+        results.add_error(f"Failed to reach {active[0].name}: {err_name} {str(node_err)}")
+        progress.set(shard, "failed")
+    finally:
+        NODE_REQUEST_SECONDS.observe(time.perf_counter() - started, node=active[0].name)
+
+async def fetch_search_results(query: str, limit: int = 10, max_lines: int = 0, max_bytes: int = 0, on_progress=None,
+                               budget: float | None = None) -> SearchResult:
+    """Streams the ripgrep results from one replica of every shard into a bounded SearchResult.
+
+    `on_progress(progress)` is called synchronously with a SearchProgress each time a shard finishes.
+    `budget` caps the whole search in seconds (see QueryAnalyzer); shards still running when it runs
+    out are stopped, their partial output is kept and `over_budget` is set on the result.
+    Cancelling the call (e.g. /cancel) aborts every in-flight node stream before re-raising.
+    """
+    results = SearchResult(max_lines=max_lines, max_bytes=max_bytes, merge=SEARCH_MERGE_RESULTS)
+    progress = SearchProgress(results, on_progress)
+    started = time.monotonic()
+    deadline = started + budget if budget else None
     try:
-        async with httpx.AsyncClient() as client:
-            for i, url in enumerate(NEXUS_API_URLS):
-                try:
-                    async with client.stream(
-                        "GET", 
-                        f"{url}/search",
-                        params={"search": query, "limit": limit},
-                        headers={"x-api-key": NEXUS_API_KEY},
-                        timeout=300.0
-                    ) as response:
-                        if response.status_code != 200:
-                            results.append(f"Error from Node-{i+1}: HTTP {response.status_code}")
-                            continue
-                        
-                        async for chunk in response.aiter_lines():
-                            text = chunk.strip()
-                            if text:
-                                if text.startswith('{"error":'):
-                                    try:
-                                        err = json.loads(text)
-                                        results.append(f"Backend Error (Node-{i+1}): {err['error']}")
-                                        continue
-                                    except:
-                                        pass
-                                results.append(text)
-                except Exception as node_err:
-                    err_name = type(node_err).__name__
-                    results.append(f"Failed to reach Node-{i+1}: {err_name} {str(node_err)}")
+        client = get_http_client()
+        if SEARCH_FANOUT_MODE == "sequential":
+            for shard in shards:
+                await _query_shard(client, shard, query, limit, deadline, results, progress)
+            return results
+
+        # Fan out to every shard at once; lines from all shards are merged into `results` as they arrive
+        tasks = {
+            asyncio.create_task(_query_shard(client, shard, query, limit, deadline, results, progress)): shard
+            for shard in shards
+        }
+        # Shards stop themselves at the budget; the overall wait only backstops that by a second
+        total_timeout = SEARCH_TOTAL_TIMEOUT if budget is None else min(SEARCH_TOTAL_TIMEOUT, budget + 1)
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=total_timeout)
+        except asyncio.CancelledError:
+            # asyncio.wait leaves its tasks running when the waiter is cancelled
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        if pending:
+            # Keep whatever the slow shards already streamed, but stop waiting on them
+            results.deadline_exceeded = True
+            results.over_budget = total_timeout < SEARCH_TOTAL_TIMEOUT
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in sorted(pending, key=lambda t: tasks[t].index):
+                if results.over_budget:
+                    results.add_error(f"{tasks[task].name}: stopped at your search time budget")
+                else:
+                    results.add_error(f"Failed to reach {tasks[task].name}: search deadline of {SEARCH_TOTAL_TIMEOUT:g}s exceeded")
+                progress.set(tasks[task], "timeout")
         return results
+    except asyncio.CancelledError:
+        results.close()
+        raise
     except Exception as e:
         logger.error(f"API Search Error: {e}")
-        return [f"Error during search: {str(e)}"]
+        results.add_error(f"Error during search: {str(e)}")
+        return results
+    finally:
+        results.elapsed = time.monotonic() - started
 
-async def create_paste(content: str) -> str:
-    """Uploads large search results to PatBin as a burn-after-reading paste."""
-    pastebin_url = PASTEBIN_URL
-    payload = {
+async def _paste_body(result: SearchResult):
+    """Yields the paste JSON payload piece by piece so the result is never held in memory as one string."""
+    meta = json.dumps({
         "title": "Nexus API Results",
-        "content": content,
         "language": "plaintext",
         "is_public": True,
         "burn_after_read": True
-    }
-    try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post(
-                f"{pastebin_url}/api/paste",
-                json=payload,
-                timeout=15.0
-            )
+    })
+    yield (meta[:-1] + ', "content": "').encode()
+    for text in result.iter_text():
+        yield json.dumps(text, ensure_ascii=False)[1:-1].encode("utf-8")
+    yield b'"}'
+
+async def _gzip_body(body):
+    """Gzips an async byte stream on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for piece in body:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Flipped off for the rest of the process once a gzipped upload fails in "auto" mode
+_paste_gzip = PASTEBIN_COMPRESSION in ("auto", "gzip")
+
+async def _post_paste(client: httpx.AsyncClient, pastebin_url: str, result: SearchResult, compressed: bool) -> httpx.Response:
+    headers = {"Content-Type": "application/json"}
+    body = _paste_body(result)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        body = _gzip_body(body)
+    async with host_slot(pastebin_url):
+        return await client.post(
+            f"{pastebin_url}/api/paste",
+            content=body,
+            headers=headers,
+            timeout=PASTEBIN_TIMEOUT
+        )
+
+async def create_paste(result: SearchResult) -> str:
+    """Uploads large search results to PatBin as a burn-after-reading paste, streaming the request body.
+
+    The body is gzipped (Content-Encoding: gzip) if PASTEBIN_COMPRESSION enables it; in "auto" mode any
+    answer but 201 or 429 to a compressed upload switches to plain bodies and retries, since servers
+    report an undecoded body in many ways (400, 415, 422, 500...). Network errors, 429 and
+    5xx answers are retried up to PASTEBIN_RETRIES times with exponential backoff. Returns "" on failure.
+    """
+    global _paste_gzip
+    pastebin_url = PASTEBIN_URL
+    client = get_http_client()
+    attempt = 0
+    while True:
+        compressed = _paste_gzip
+        try:
+            res = await _post_paste(client, pastebin_url, result, compressed)
+            if compressed and PASTEBIN_COMPRESSION == "auto" and res.status_code not in (201, 429):
+                logger.warning(f"Pastebin rejected a gzipped upload (HTTP {res.status_code}); sending plain bodies from now on")
+                _paste_gzip = False
+                continue
             if res.status_code == 201:
                 data = res.json()
                 return f"{pastebin_url}/{data['id']}"
-            else:
+            if res.status_code != 429 and res.status_code < 500:
+                logger.error(f"PasteBin Error: HTTP {res.status_code}")
                 return ""
-    except Exception as e:
-        logger.error(f"PasteBin Error: {e}")
-        return ""
-    return ""
\ No newline at end of file
+            error = f"HTTP {res.status_code}"
+        except httpx.TransportError as e:
+            error = f"{type(e).__name__} {e}"
+        except Exception as e:
+            logger.error(f"PasteBin Error: {e}")
+            return ""
+        if attempt >= PASTEBIN_RETRIES:
+            logger.error(f"PasteBin Error: {error} (gave up after {attempt + 1} attempts)")
+            return ""
+        delay = PASTEBIN_RETRY_BACKOFF * 2 ** attempt
+        attempt += 1
+        logger.warning(f"PasteBin attempt {attempt} failed ({error}), retrying in {delay:g}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+from modules.config import (
+    ADMIN_ID, BROADCAST_RATE, BROADCAST_MAX_RATE, BROADCAST_BATCH_SIZE,
+    BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL, BROADCAST_STALE_AFTER
+)
+from modules.database import users_col, broadcasts_col
+
+logger = logging.getLogger("broadcast")
+
+class AdaptiveRateLimiter:
+    """Token bucket that backs off on Telegram flood waits and creeps back up while sends succeed."""
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 1.0):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        # Additive increase towards the configured ceiling
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+    def on_flood_wait(self, seconds: int):
+        # Multiplicative decrease, and pause every sender for the time Telegram asked for
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class Broadcast:
+    """A single broadcast job whose progress is checkpointed in the broadcasts collection."""
+
+    def __init__(self, client: TelegramClient, doc: dict):
+        self.client = client
+        self.id = doc["_id"]
+        self.text = doc["text"]
+        self.total = doc.get("total", 0)
+        self.sent = doc.get("sent", 0)
+        self.failed = doc.get("failed", 0)
+        self.last_user_id = doc.get("last_user_id")
+        self.started = time.monotonic()
+        self.sent_at_start = self.sent + self.failed
+        self.limiter = AdaptiveRateLimiter(BROADCAST_RATE, BROADCAST_MAX_RATE)
+        self.cancelled = False
+        self.task: asyncio.Task | None = None
+        self.progress_msg = None
+
+    def progress_text(self) -> str:
+        done = self.sent + self.failed
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        speed = (done - self.sent_at_start) / elapsed
+        remaining = max(self.total - done, 0)
+        eta = f"{int(remaining / speed // 60)}m" if speed > 0 else "?"
+        return (
+            f"📣 **Broadcast progress:** {done}/{self.total}\n"
+            f"✅ Sent: {self.sent} | ❌ Failed: {self.failed}\n"
+            f"⚡ Rate: {speed:.1f} msg/s (limit {self.limiter.rate:.1f}) | ETA: {eta}"
+        )
+
+    async def _send(self, user_id: int):
+        for _ in range(3):
+            await self.limiter.acquire()
+            try:
+                await self.client.send_message(user_id, self.text)
+                self.limiter.on_success()
+                self.sent += 1
+                return
+            except FloodWaitError as e:
+                logger.warning(f"Flood wait of {e.seconds}s during broadcast {self.id}")
+                self.limiter.on_flood_wait(e.seconds)
+            except Exception:
+                # Blocked the bot, deactivated account, etc.
+                break
+        self.failed += 1
+
+    async def _checkpoint(self, status: str = "running"):
+        await broadcasts_col.update_one(
+            {"_id": self.id},
+            {"$set": {
+                "status": status,
+                "sent": self.sent,
+                "failed": self.failed,
+                "last_user_id": self.last_user_id,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+
+    async def _report(self):
+        text = self.progress_text()
+        try:
+            if self.progress_msg:
+                await self.progress_msg.edit(text)
+            else:
+                self.progress_msg = await self.client.send_message(ADMIN_ID, text)
+        except Exception:
+            pass
+
+    async def run(self):
+        last_report = 0.0
+        query = {} if self.last_user_id is None else {"user_id": {"$gt": self.last_user_id}}
+        cursor = users_col.find(query, {"user_id": 1}).sort("user_id", 1).batch_size(BROADCAST_BATCH_SIZE)
+        workers = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+        async def send_one(user_id: int):
+            async with workers:
+                if not self.cancelled:
+                    await self._send(user_id)
+
+        try:
+            batch = []
+            async for user in cursor:
+                if self.cancelled:
+                    break
+                batch.append(user["user_id"])
+                if len(batch) < BROADCAST_BATCH_SIZE:
+                    continue
+                await asyncio.gather(*(send_one(uid) for uid in batch))
+                # Checkpoint after each batch so a restart resumes from here
+                self.last_user_id = batch[-1]
+                batch = []
+                await self._checkpoint()
+                if time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report()
+
+            if batch and not self.cancelled:
+                await asyncio.gather(*(send_one(uid) for uid in batch))
+                self.last_user_id = batch[-1]
+
+            status = "cancelled" if self.cancelled else "done"
+            await self._checkpoint(status)
+            try:
+                await self.client.send_message(
+                    ADMIN_ID,
+                    f"{'🛑 Broadcast cancelled' if self.cancelled else '✅ Broadcast finished'}. "
+                    f"Reached {self.sent}/{self.total} users ({self.failed} failed)."
+                )
+            except:
+                pass
+        except Exception as e:
+            logger.error(f"Broadcast {self.id} stopped: {e}")
+            await self._checkpoint("failed")
+        finally:
+            global _active
+            if _active is self:
+                _active = None
+
+_active: Broadcast | None = None
+
+def get_active_broadcast() -> Broadcast | None:
+    return _active
+
+async def start_broadcast(client: TelegramClient, text: str) -> Broadcast | None:
+    """Starts a new broadcast. Returns None if one is already running or there is nobody to send to."""
+    global _active
+    total = await users_col.estimated_document_count()
+    if _active or total == 0:
+        return None
+    doc = {
+        "_id": f"bc-{int(time.time())}",
+        "text": text,
+        "status": "running",
+        "total": total,
+        "sent": 0,
+        "failed": 0,
+        "last_user_id": None,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+    await broadcasts_col.insert_one(doc)
+    _active = Broadcast(client, doc)
+    _active.task = asyncio.create_task(_active.run())
+    return _active
+
+async def resume_broadcast(client: TelegramClient, stale_after: float = 0):
+    """Picks up a broadcast that was still running when the bot last stopped.
+
+    With `stale_after`, only a broadcast whose last checkpoint is at least that old is taken over,
+    so one still being run by another process is left alone.
+    """
+    global _active
+    try:
+        query = {"status": "running"}
+        if stale_after:
+            query["updated_at"] = {"$lt": datetime.utcnow() - timedelta(seconds=stale_after)}
+        doc = await broadcasts_col.find_one(query, sort=[("created_at", -1)])
+        if not doc or _active:
+            return
+        _active = Broadcast(client, doc)
+        _active.task = asyncio.create_task(_active.run())
+        logger.info(f"Resuming broadcast {doc['_id']} after user {doc.get('last_user_id')}")
+        await client.send_message(ADMIN_ID, f"♻️ Resuming broadcast from {doc.get('sent', 0) + doc.get('failed', 0)}/{doc.get('total', 0)}.")
+    except Exception as e:
+        logger.error(f"Failed to resume broadcast: {e}")
+
+async def watch_broadcasts(client: TelegramClient):
+    """Cluster-mode leader task: takes over broadcasts whose process stopped checkpointing."""
+    while True:
+        await resume_broadcast(client, stale_after=BROADCAST_STALE_AFTER)
+        await asyncio.sleep(BROADCAST_STALE_AFTER / 2)
+
+def cancel_broadcast() -> bool:
+    """Requests the running broadcast to stop after its current batch."""
+    if not _active:
+        return False
+    _active.cancelled = True
+    return True
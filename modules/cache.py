@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from modules.api_client import SearchResult
+from modules.config import (
+    RESULT_CACHE_ENABLED, RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRY_BYTES, RESULT_CACHE_DIR
+)
+
+logger = logging.getLogger("cache")
+
+def normalize_query(query: str) -> str:
+    """Collapses whitespace so trivially different spellings of a query share a cache entry."""
+    return " ".join(query.split())
+
+class ResultCache:
+    """TTL + LRU cache of search results with an optional on-disk tier and in-flight request coalescing."""
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, max_entry_bytes: int, disk_dir: str = "", enabled: bool = True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.disk_dir = disk_dir
+        self.enabled = enabled
+        # key -> (stored_at, payload, line_count, file_count, truncated)
+        self._entries: OrderedDict[str, tuple[float, bytes, int, int, bool]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # The disk tier is swept of expired files, then trimmed to max_bytes (oldest first), this often
+        self.sweep_interval = min(ttl, 300.0)
+        self._last_sweep = 0.0
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(query: str, limit: int) -> str:
+        return f"{limit}:{normalize_query(query)}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest() + ".cache")
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, (_, payload, _, _) = self._entries.popitem(last=False)
+            self.bytes -= len(payload)
+
+    def _store(self, key: str, stored_at: float, payload: bytes, line_count: int, file_count: int = 0,
+               truncated: bool = False):
+        old = self._entries.pop(key, None)
+        if old:
+            self.bytes -= len(old[1])
+        self._entries[key] = (stored_at, payload, line_count, file_count, truncated)
+        self.bytes += len(payload)
+        self._evict()
+
+    def _read_disk(self, key: str):
+        # File layout: one JSON header line followed by the raw result payload
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("key") != key:
+                    return None
+                if time.time() - header["stored_at"] < self.ttl:
+                    return (header["stored_at"], f.read(), header["line_count"], header.get("file_count", 0),
+                            header.get("truncated", False))
+            # Expired: drop the file now rather than waiting for the next sweep
+            self._remove_disk(key)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Disk cache read failed: {e}")
+        return None
+
+    def _write_disk(self, key: str, stored_at: float, payload: bytes, line_count: int, file_count: int,
+                    truncated: bool):
+        try:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                header = {"key": key, "stored_at": stored_at, "line_count": line_count, "file_count": file_count,
+                          "truncated": truncated}
+                f.write(json.dumps(header).encode() + b"\n")
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+        except Exception as e:
+            logger.warning(f"Disk cache write failed: {e}")
+
+    @staticmethod
+    def _unlink(path: str):
+        # Another sweep or an expired read may have removed the file already
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _remove_disk(self, key: str):
+        try:
+            self._unlink(self._disk_path(key))
+        except Exception as e:
+            logger.warning(f"Disk cache delete failed: {e}")
+
+    def _sweep_disk(self):
+        """Deletes expired files and stale temp files, then the oldest files until the tier fits in max_bytes."""
+        now = time.time()
+        files = []
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    # Files are written once at stored_at, so the mtime is the entry's age
+                    if now - stat.st_mtime >= self.ttl:
+                        self._unlink(entry.path)
+                    elif entry.name.endswith(".cache"):
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self._unlink(path)
+                total -= size
+        except Exception as e:
+            logger.warning(f"Disk cache sweep failed: {e}")
+
+    async def get(self, key: str):
+        """Returns a cached SearchResult for `key`, or None. Counts a miss only when neither tier has it."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry:
+            if time.time() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return SearchResult.from_bytes(entry[1], entry[2], file_count=entry[3], truncated=entry[4])
+            self._entries.pop(key)
+            self.bytes -= len(entry[1])
+            if self.disk_dir:
+                # The disk copy has the same stored_at, so it has expired too
+                await asyncio.to_thread(self._remove_disk, key)
+                self.misses += 1
+                return None
+        if self.disk_dir:
+            found = await asyncio.to_thread(self._read_disk, key)
+            if found:
+                self._store(key, *found)
+                self.disk_hits += 1
+                return SearchResult.from_bytes(found[1], found[2], file_count=found[3], truncated=found[4])
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, result: SearchResult):
+        # Partial or failed searches are never cached so a flaky node cannot pin a bad result,
+        # and large results are skipped so the cache never holds a big payload in memory
+        if not self.enabled or result.errors or result.bytes > self.max_entry_bytes:
+            return
+        stored_at = time.time()
+        payload = result.getvalue()
+        self._store(key, stored_at, payload, result.line_count, result.file_count, result.truncated)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, stored_at, payload, result.line_count, result.file_count,
+                                    result.truncated)
+            if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = time.monotonic()
+                await asyncio.to_thread(self._sweep_disk)
+
+    async def get_or_fetch(self, key: str, fetch):
+        """Runs `fetch()` at most once per key at a time; identical concurrent callers share its result."""
+        if not self.enabled:
+            return await fetch()
+        pending = self._inflight.get(key)
+        if pending:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+            except Exception:
+                pass
+            # The leading request failed or was cancelled; run the fetch ourselves
+            return await self.get_or_fetch(key, fetch)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await fetch()
+            await self.put(key, results)
+            future.set_result(results)
+            return results
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no follower was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+search_cache = ResultCache(
+    ttl=RESULT_CACHE_TTL,
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    max_entry_bytes=RESULT_CACHE_MAX_ENTRY_BYTES,
+    disk_dir=RESULT_CACHE_DIR,
+    enabled=RESULT_CACHE_ENABLED
+)
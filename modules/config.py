@@ -1,4 +1,6 @@
+import json
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,14 +12,168 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "nexus_bot_db")
 
+# In-process user document cache for the handler hot path
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+# /stats is recomputed at most this often (seconds)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "60"))
+# Global stat increments are buffered in memory and flushed this often (seconds)
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "5"))
+
 _urls_env = os.getenv(
     "NEXUS_API_URLS",
     "https://aadityapawarx1-nexus-api-1.hf.space,https://aadityapawarx1-nexus-api-2.hf.space,https://aadityapawarx1-nexus-api-3.hf.space,https://aadityapawarx1-nexus-api-4.hf.space,https://aadityapawarx1-nexus-api-5.hf.space,https://aadityapawarx1-nexus-api-6.hf.space"
 )
 NEXUS_API_URLS = [url.strip() for url in _urls_env.split(",") if url.strip()]
+# Optional shard map, JSON object of shard name -> replica URLs, e.g. {"shard-1": ["https://a", "https://b"]}.
+# Each search queries one replica per shard. Without it every NEXUS_API_URLS entry is its own shard.
+_shards_env = os.getenv("NEXUS_SHARDS", "").strip()
+if _shards_env:
+    NEXUS_SHARDS = {name: [url.strip() for url in urls if url.strip()] for name, urls in json.loads(_shards_env).items()}
+    NEXUS_API_URLS = list(dict.fromkeys(url for urls in NEXUS_SHARDS.values() for url in urls))
+else:
+    NEXUS_SHARDS = {f"Node-{i+1}": [url] for i, url in enumerate(NEXUS_API_URLS)}
 NEXUS_API_KEY = os.getenv("NEXUS_API_KEY", "")
 
+# Search fan-out: "concurrent" streams from every node at once, "sequential" queries them one by one
+SEARCH_FANOUT_MODE = os.getenv("SEARCH_FANOUT_MODE", "concurrent").lower()
+# Per-node deadline and overall deadline for a single search (seconds)
+SEARCH_NODE_TIMEOUT = float(os.getenv("SEARCH_NODE_TIMEOUT", "300"))
+SEARCH_TOTAL_TIMEOUT = float(os.getenv("SEARCH_TOTAL_TIMEOUT", "320"))
+# Per-tier caps on a single search's output; further lines are dropped
+SEARCH_MAX_LINES_FREE = int(os.getenv("SEARCH_MAX_LINES_FREE", "5000"))
+SEARCH_MAX_LINES_PREMIUM = int(os.getenv("SEARCH_MAX_LINES_PREMIUM", "50000"))
+SEARCH_MAX_BYTES_FREE = int(os.getenv("SEARCH_MAX_BYTES_FREE", str(2 * 1024 * 1024)))
+SEARCH_MAX_BYTES_PREMIUM = int(os.getenv("SEARCH_MAX_BYTES_PREMIUM", str(16 * 1024 * 1024)))
+# Search scheduler: global concurrency, per-node in-flight cap and premium queue priority
+SEARCH_MAX_CONCURRENT = int(os.getenv("SEARCH_MAX_CONCURRENT", "10"))
+SEARCH_NODE_MAX_INFLIGHT = int(os.getenv("SEARCH_NODE_MAX_INFLIGHT", "10"))
+# Premium searches are queued as if they had arrived this many seconds earlier
+SCHEDULER_PREMIUM_HEAD_START = float(os.getenv("SCHEDULER_PREMIUM_HEAD_START", "120"))
+# Minimum seconds between queue-position edits of the wait message
+QUEUE_UPDATE_INTERVAL = float(os.getenv("QUEUE_UPDATE_INTERVAL", "5"))
+# Minimum seconds between per-node progress edits of the wait message while a search runs
+SEARCH_PROGRESS_INTERVAL = float(os.getenv("SEARCH_PROGRESS_INTERVAL", "3"))
+# Results are buffered in memory up to this size, then spooled to a temp file
+SEARCH_SPOOL_MEMORY = int(os.getenv("SEARCH_SPOOL_MEMORY", str(256 * 1024)))
+# Merge stage: drop identical hits returned by several nodes and keep each node's files contiguous
+SEARCH_MERGE_RESULTS = os.getenv("SEARCH_MERGE_RESULTS", "true").lower() in ("1", "true", "yes")
+# Max line hashes remembered per search for deduplication (~100 bytes each); later lines pass unchecked
+SEARCH_DEDUP_MAX_HASHES = int(os.getenv("SEARCH_DEDUP_MAX_HASHES", "200000"))
+# Query cost guard: required run of plain characters, max query length, and whether free users may send
+# regex (otherwise their queries are searched literally)
+QUERY_MIN_LITERAL = int(os.getenv("QUERY_MIN_LITERAL", "3"))
+QUERY_MAX_LENGTH = int(os.getenv("QUERY_MAX_LENGTH", "256"))
+QUERY_REGEX_FREE = os.getenv("QUERY_REGEX_FREE", "false").lower() in ("1", "true", "yes")
+# Per-tier time budget for one search (seconds), also sent to the nodes as a deadline. A search stopped
+# by its budget delivers what it has and is not counted against the user's daily limit.
+QUERY_BUDGET_FREE = float(os.getenv("QUERY_BUDGET_FREE", "30"))
+QUERY_BUDGET_PREMIUM = float(os.getenv("QUERY_BUDGET_PREMIUM", "120"))
+# Cost estimates come only from each query's own history (per tier): a query's timing is forgotten after
+# this many seconds without a new sample, and at most this many queries are kept
+QUERY_COST_TTL = float(os.getenv("QUERY_COST_TTL", "3600"))
+QUERY_COST_MAX_ENTRIES = int(os.getenv("QUERY_COST_MAX_ENTRIES", "10000"))
+# Fraction of queries refused as too expensive that are run anyway, so a stale estimate gets corrected
+QUERY_COST_RESAMPLE = float(os.getenv("QUERY_COST_RESAMPLE", "0.1"))
+
+# Background cluster health monitor and per-node circuit breakers
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "30"))
+# Health data older than this is refreshed inline before being trusted
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", "120"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "60"))
+# Replica routing: EWMA weight of the newest latency/error sample, and hedged requests, which open a
+# second replica once the first has not answered within its recent p95 (needs HEDGE_MIN_SAMPLES samples)
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+SEARCH_HEDGE_ENABLED = os.getenv("SEARCH_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+
+# Search result cache (keyed by normalized query + tier limit)
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger results are not cached so a single search never pins a big payload in memory
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+# Directory for the on-disk cache tier that survives restarts (empty disables it)
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+
+# Shared HTTP connection pool used for Nexus and pastebin traffic
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "40"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+# Max concurrent requests per host (0 disables the cap)
+HTTP_PER_HOST_CONNECTIONS = int(os.getenv("HTTP_PER_HOST_CONNECTIONS", "20"))
+# HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
 PASTEBIN_URL = os.getenv("PASTEBIN_URL", "https://aadityapawarx1-mypastebin.hf.space")
+# Paste upload compression: "off" (plain bodies), "auto" (gzip, falling back to plain on any failed gzipped
+# upload) or "gzip". Only enable it for a pastebin known to accept Content-Encoding: gzip
+PASTEBIN_COMPRESSION = os.getenv("PASTEBIN_COMPRESSION", "off").lower()
+# Per-attempt paste timeout (seconds), retries on network errors / 429 / 5xx, and the first backoff delay (doubles)
+PASTEBIN_TIMEOUT = float(os.getenv("PASTEBIN_TIMEOUT", "15"))
+PASTEBIN_RETRIES = int(os.getenv("PASTEBIN_RETRIES", "2"))
+PASTEBIN_RETRY_BACKOFF = float(os.getenv("PASTEBIN_RETRY_BACKOFF", "1"))
+# Results larger than this (bytes) skip the pastebin and are uploaded to the chat as a document
+DELIVERY_FILE_THRESHOLD = int(os.getenv("DELIVERY_FILE_THRESHOLD", str(4 * 1024 * 1024)))
+# Gzip uploaded result documents (.txt.gz)
+DELIVERY_FILE_GZIP = os.getenv("DELIVERY_FILE_GZIP", "false").lower() in ("1", "true", "yes")
+
+# Premium expiry scheduler: cursor batch size, parallel reminder sends, and a safety cap on sleep (seconds)
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "100"))
+EXPIRY_SEND_CONCURRENCY = int(os.getenv("EXPIRY_SEND_CONCURRENCY", "5"))
+EXPIRY_MAX_SLEEP = float(os.getenv("EXPIRY_MAX_SLEEP", "3600"))
+
+# Broadcast engine: starting/maximum send rate (msg/s), cursor batch size and parallel senders
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))
+BROADCAST_MAX_RATE = float(os.getenv("BROADCAST_MAX_RATE", "28"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+# Seconds between live progress edits sent to the admin
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "15"))
+
+# Local Prometheus-format metrics endpoint (set METRICS_PORT=0 to disable). Several processes on one host
+# need one port each; a process that cannot bind its port logs a warning and runs without the endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Process role: "standalone" runs everything in one process. "frontend" runs the Telegram handlers and
+# enqueues /search jobs in Mongo, and "worker" processes claim and run them. The singleton background
+# tasks (expiry reminders, broadcast recovery) run on whichever frontend/worker holds the leader lease.
+BOT_ROLE = os.getenv("BOT_ROLE", "standalone").lower()
+JOB_QUEUE_ENABLED = BOT_ROLE in ("frontend", "worker")
+WORKER_ID = os.getenv("WORKER_ID", "") or f"{socket.gethostname()}-{os.getpid()}"
+# Global cap on running search jobs across all workers, and per-worker cap
+JOB_MAX_RUNNING = int(os.getenv("JOB_MAX_RUNNING", str(SEARCH_MAX_CONCURRENT)))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "5"))
+# A claimed job or slot is released if its worker stops renewing the lease for this long (seconds)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# Finished or orphaned job documents are removed by a TTL index after this many seconds
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "3600"))
+# Largest gzipped result a worker hands back through Mongo (documents are capped at 16 MB)
+JOB_MAX_RESULT_BYTES = int(os.getenv("JOB_MAX_RESULT_BYTES", str(12 * 1024 * 1024)))
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+# A running broadcast whose checkpoint is older than this is taken over by the leader (seconds)
+BROADCAST_STALE_AFTER = float(os.getenv("BROADCAST_STALE_AFTER", "300"))
+
+# Per-user command flood control: burst size and sustained commands per second (FLOOD_RATE=0 disables it)
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "5"))
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "0.5"))
+# Idle users' buckets are dropped once this many users are tracked
+FLOOD_MAX_TRACKED = int(os.getenv("FLOOD_MAX_TRACKED", "50000"))
+
+# Admin batch commands: max keys per /genkey, and max user IDs / ID-file size per /ban or /unban
+GENKEY_MAX_BATCH = int(os.getenv("GENKEY_MAX_BATCH", "10000"))
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "100000"))
+BULK_MAX_FILE_BYTES = int(os.getenv("BULK_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+
+# On SIGTERM/SIGINT, seconds to let in-flight searches (or a worker's running jobs) finish before cancelling them
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "60"))
 
 # The owner/admin Telegram User ID
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
\ No newline at end of file
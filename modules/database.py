@@ -1,15 +1,168 @@
+import asyncio
+import secrets
+import time
+from collections import OrderedDict
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime, timedelta
-from modules.config import MONGO_URI, DB_NAME
+from modules.metrics import timed_db
+from modules.config import (
+    MONGO_URI, DB_NAME, USER_CACHE_ENABLED, USER_CACHE_TTL, USER_CACHE_MAX_SIZE, STATS_CACHE_TTL,
+    STATS_FLUSH_INTERVAL, JOB_RETENTION
+)
 
-client = AsyncIOMotorClient(MONGO_URI)
+# connect=False defers connecting (and pymongo's monitor threads) to the first operation, so importing
+# this module is free and the connection is made in init_db() alongside the Telegram login
+client = AsyncIOMotorClient(MONGO_URI, connect=False)
 db = client[DB_NAME]
 
 users_col = db['users']
 keys_col = db['keys']
 stats_col = db['stats']
+broadcasts_col = db['broadcasts']
+jobs_col = db['search_jobs']
+locks_col = db['locks']
+
+logger = logging.getLogger("database")
+
+class UserCache:
+    """Bounded, TTL-evicting cache of user documents so hot users cost no Mongo reads per command."""
+
+    def __init__(self, ttl: float, max_size: int, enabled: bool = True):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self._users: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int):
+        if not self.enabled:
+            return None
+        entry = self._users.get(user_id)
+        if entry:
+            if time.monotonic() - entry[0] < self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                # Hand out a copy so callers can't mutate the cached document by accident
+                return dict(entry[1])
+            del self._users[user_id]
+        self.misses += 1
+        return None
+
+    def put(self, user: dict):
+        if not self.enabled or not user:
+            return
+        self._users[user['user_id']] = (time.monotonic(), dict(user))
+        self._users.move_to_end(user['user_id'])
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def apply(self, user_id: int, update: dict):
+        """Write-through for simple $set/$inc updates; anything else just invalidates the entry."""
+        entry = self._users.get(user_id)
+        if not entry:
+            return
+        if set(update) - {"$set", "$inc"}:
+            self.invalidate(user_id)
+            return
+        user = entry[1]
+        user.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            user[field] = user.get(field, 0) + amount
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._users),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+user_cache = UserCache(ttl=USER_CACHE_TTL, max_size=USER_CACHE_MAX_SIZE, enabled=USER_CACHE_ENABLED)
+
+class StatsWriter:
+    """Write-behind aggregator for counter documents in the stats collection.
+
+    Increments are summed in memory and flushed with one bulk_write every `interval` seconds,
+    so hot counters like bot_stats cost no Mongo write on the request path.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pending: dict[str, dict[str, int]] = {}
+        self._lock = asyncio.Lock()
+
+    def add(self, doc_id: str, **increments: int):
+        counters = self.pending.setdefault(doc_id, {})
+        for field, amount in increments.items():
+            counters[field] = counters.get(field, 0) + amount
+
+    def pending_for(self, doc_id: str) -> dict[str, int]:
+        return dict(self.pending.get(doc_id, {}))
+
+    async def flush(self):
+        """Writes all pending increments. On failure they are merged back and retried next flush."""
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                await stats_col.bulk_write(
+                    [UpdateOne({"_id": doc_id}, {"$inc": incs}, upsert=True) for doc_id, incs in batch.items()],
+                    ordered=False
+                )
+            except BaseException as e:
+                logger.error(f"Stats flush failed, will retry: {e!r}")
+                for doc_id, incs in batch.items():
+                    self.add(doc_id, **incs)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+
+    async def run(self):
+        """Background flush loop. Flushes once more when cancelled so nothing is lost on clean exit."""
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+stats_writer = StatsWriter(interval=STATS_FLUSH_INTERVAL)
+
+async def ensure_indexes():
+    """Creates the indexes the hot queries rely on. Safe to run on every start."""
+    specs = [
+        (users_col, [("user_id", ASCENDING)], {"unique": True}),
+        # Premium expiry reminders: type + premium_expiry range + notified flag
+        (users_col, [("type", ASCENDING), ("premium_expiry", ASCENDING), ("notified_expiry", ASCENDING)], {}),
+        # Also serves the {key_string, is_used} redemption lookup
+        (keys_col, [("key_string", ASCENDING)], {"unique": True}),
+        (broadcasts_col, [("status", ASCENDING), ("created_at", ASCENDING)], {}),
+        # Job claims: oldest-priority queued job first
+        (jobs_col, [("status", ASCENDING), ("priority", ASCENDING)], {}),
+        (jobs_col, [("created_at", ASCENDING)], {"expireAfterSeconds": JOB_RETENTION}),
+    ]
+    for col, keys, options in specs:
+        try:
+            await col.create_index(keys, **options)
+        except Exception as e:
+            logger.error(f"Failed to create index {keys} on {col.name}: {e}")
 
 async def init_db():
+    """Connects to Mongo and fails fast if it is unreachable. Index builds run later in warm_up_db()."""
+    await client.admin.command("ping")
+
+async def warm_up_db():
+    """Background start-up work: indexes, the stats document and a first /stats computation."""
+    await ensure_indexes()
+
     # Ensure stats document exists
     if not await stats_col.find_one({"_id": "bot_stats"}):
         await stats_col.insert_one({
@@ -18,10 +171,20 @@ async def init_db():
             "total_results": 0
         })
 
+    # Fill the /stats cache so the first caller doesn't pay for the aggregation
+    await get_stats()
+
+@timed_db
 async def get_user(user_id: int):
-    return await users_col.find_one({"user_id": user_id})
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await users_col.find_one({"user_id": user_id})
+        user_cache.put(user)
+    return user
 
-async def create_user(user_id: int, referrer_id: int = None):
+@timed_db
+async def create_user(user_id: int, referrer_id: int = None) -> tuple[dict, bool]:
+    """Inserts a new user. Returns (user, created); `created` is False if a concurrent command inserted it first."""
     user = {
         "user_id": user_id,
         "type": "free",  # 'free' or 'premium'
@@ -32,56 +195,167 @@ async def create_user(user_id: int, referrer_id: int = None):
         "referral_count": 0,
         "is_banned": False
     }
-    await users_col.insert_one(user)
-    return user
+    try:
+        await users_col.insert_one(user)
+    except DuplicateKeyError:
+        # Lost the race against the unique user_id index: use the document that won
+        return await users_col.find_one({"user_id": user_id}), False
+    user_cache.put(user)
+    return user, True
+
+@timed_db
+async def consume_search_quota(user_id: int, limit: int):
+    """Atomically resets the daily counter if 24h have passed and consumes one search.
 
-async def check_and_reset_limits(user):
+    One round trip, race-free under concurrent searches. Returns the updated user document,
+    or None if the user has already used `limit` searches today.
+    """
     now = datetime.utcnow()
-    # If 24 hours have passed since last reset, reset searches
-    if now - user['last_reset'] >= timedelta(days=1):
-        await users_col.update_one(
-            {"user_id": user['user_id']},
-            {"$set": {"searches_today": 0, "last_reset": now}}
-        )
-        return 0
-    return user['searches_today']
-
-async def increment_search_usage(user_id: int, results_count: int):
-    await users_col.update_one({"user_id": user_id}, {"$inc": {"searches_today": 1}})
-    await stats_col.update_one(
-        {"_id": "bot_stats"},
-        {"$inc": {"total_searches": 1, "total_results": results_count}}
+    cutoff = now - timedelta(days=1)
+    is_stale = {"$lte": ["$last_reset", cutoff]}
+    user = await users_col.find_one_and_update(
+        {
+            "user_id": user_id,
+            "$or": [{"last_reset": {"$lte": cutoff}}, {"searches_today": {"$lt": limit}}]
+        },
+        [{"$set": {
+            "searches_today": {"$cond": [is_stale, 1, {"$add": ["$searches_today", 1]}]},
+            "last_reset": {"$cond": [is_stale, now, "$last_reset"]}
+        }}],
+        return_document=ReturnDocument.AFTER
     )
+    if user:
+        user_cache.put(user)
+    return user
+
+@timed_db
+async def refund_search_quota(user_id: int):
+    """Gives back a search consumed by consume_search_quota when nothing was delivered."""
+    await users_col.update_one({"user_id": user_id, "searches_today": {"$gt": 0}}, {"$inc": {"searches_today": -1}})
+    user_cache.invalidate(user_id)
+
+def record_search_stats(results_count: int):
+    # Buffered by the write-behind StatsWriter; flushed in the background and on shutdown
+    stats_writer.add("bot_stats", total_searches=1, total_results=results_count)
 
+def _extend_premium(days: int, now: datetime, condition=True) -> dict:
+    """Pipeline $set stage extending premium by `days` from max(now, current expiry) when `condition` holds."""
+    new_expiry = {"$add": [{"$max": [{"$ifNull": ["$premium_expiry", now]}, now]}, days * 24 * 3600 * 1000]}
+    return {"$set": {
+        "type": {"$cond": [condition, "premium", "$type"]},
+        "premium_expiry": {"$cond": [condition, new_expiry, "$premium_expiry"]},
+        "notified_expiry": {"$cond": [condition, False, {"$ifNull": ["$notified_expiry", False]}]}
+    }}
+
+@timed_db
 async def handle_referral(referrer_id: int):
-    referrer = await get_user(referrer_id)
+    """Credits a referral and, every 5th one, grants a week of premium in a single atomic update."""
+    now = datetime.utcnow()
+    referrer = await users_col.find_one_and_update(
+        {"user_id": referrer_id},
+        [
+            {"$set": {"referral_count": {"$add": [{"$ifNull": ["$referral_count", 0]}, 1]}}},
+            # Every 5 users = 1 week premium
+            _extend_premium(7, now, condition={"$eq": [{"$mod": ["$referral_count", 5]}, 0]})
+        ],
+        return_document=ReturnDocument.AFTER
+    )
+    user_cache.invalidate(referrer_id)
     if referrer:
-        new_count = referrer.get('referral_count', 0) + 1
-        updates = {"referral_count": new_count}
-        
-        # Every 5 users = 1 week premium
-        if new_count % 5 == 0:
-            current_expiry = referrer.get('premium_expiry') or datetime.utcnow()
-            if current_expiry < datetime.utcnow():
-                current_expiry = datetime.utcnow()
-            
-            updates['type'] = 'premium'
-            updates['premium_expiry'] = current_expiry + timedelta(days=7)
-            
-        await users_col.update_one({"user_id": referrer_id}, {"$set": updates})
-        return new_count % 5 == 0  # True if they just earned a reward
+        return referrer['referral_count'] % 5 == 0  # True if they just earned a reward
     return False
 
-async def get_stats():
-    stats = await stats_col.find_one({"_id": "bot_stats"})
-    total_users = await users_col.count_documents({})
-    free_users = await users_col.count_documents({"type": "free"})
-    premium_users = await users_col.count_documents({"type": "premium"})
-    
+@timed_db
+async def redeem_key(user_id: int, key_str: str):
+    """Claims an unused key and applies its premium days. Returns the key's duration, or None if invalid."""
+    # Claiming the key is atomic, so the same key can never be redeemed twice
+    key_doc = await keys_col.find_one_and_update(
+        {"key_string": key_str, "is_used": False},
+        {"$set": {"is_used": True, "used_by": user_id}}
+    )
+    if not key_doc:
+        return None
+
+    if not await get_user(user_id):
+        await create_user(user_id)  # A concurrent insert is fine: the update below applies either way
+
+    await users_col.update_one({"user_id": user_id}, [_extend_premium(key_doc['duration_days'], datetime.utcnow())])
+    user_cache.invalidate(user_id)
+    return key_doc['duration_days']
+
+# Unambiguous characters only (no 0/O, 1/I/L), so keys survive being read out or retyped
+_KEY_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+def new_key_string() -> str:
+    """A random NEXUS-XXXX-XXXX-XXXX key (~59 bits); uniqueness is enforced by the key_string index."""
+    chars = "".join(secrets.choice(_KEY_ALPHABET) for _ in range(12))
+    return f"NEXUS-{chars[:4]}-{chars[4:8]}-{chars[8:]}"
+
+@timed_db
+async def create_keys(count: int, duration_days: int) -> list[str]:
+    """Generates `count` premium keys with one insert_many.
+
+    The unique index on key_string rejects any collision; only the rejected keys are regenerated
+    and inserted again, so every returned key is stored and distinct.
+    """
+    created: list[str] = []
+    pending = count
+    for _ in range(5):
+        batch = [new_key_string() for _ in range(pending)]
+        try:
+            await keys_col.insert_many(
+                [{"key_string": key, "duration_days": duration_days, "is_used": False} for key in batch],
+                ordered=False
+            )
+            return created + batch
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            duplicates = {err["index"] for err in errors}
+            created += [key for i, key in enumerate(batch) if i not in duplicates]
+            pending = len(duplicates)
+    raise RuntimeError(f"Could not generate unique keys, {pending} collision(s) left")
+
+@timed_db
+async def set_banned(user_ids: list[int], banned: bool) -> tuple[int, int]:
+    """Bans or unbans many users with one bulk_write. Returns (matched, modified) counts."""
+    result = await users_col.bulk_write(
+        [UpdateOne({"user_id": user_id}, {"$set": {"is_banned": banned}}) for user_id in user_ids],
+        ordered=False
+    )
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+    return result.matched_count, result.modified_count
+
+_stats_cache = {"expires": 0.0, "value": None}
+_stats_lock = asyncio.Lock()
+
+async def _compute_stats():
+    # One pass over users grouped by tier, run alongside the bot_stats lookup
+    tiers_cursor = users_col.aggregate([{"$group": {"_id": "$type", "count": {"$sum": 1}}}])
+    stats, tiers = await asyncio.gather(
+        stats_col.find_one({"_id": "bot_stats"}),
+        tiers_cursor.to_list(length=None)
+    )
+    stats = stats or {}
+    counts = {tier["_id"]: tier["count"] for tier in tiers}
+    # Include increments that have not been flushed yet
+    pending = stats_writer.pending_for("bot_stats")
+
     return {
-        "total_searches": stats.get("total_searches", 0),
-        "total_results": stats.get("total_results", 0),
-        "total_users": total_users,
-        "free_users": free_users,
-        "premium_users": premium_users
-    }
\ No newline at end of file
+        "total_searches": stats.get("total_searches", 0) + pending.get("total_searches", 0),
+        "total_results": stats.get("total_results", 0) + pending.get("total_results", 0),
+        "total_users": sum(counts.values()),
+        "free_users": counts.get("free", 0),
+        "premium_users": counts.get("premium", 0)
+    }
+
+@timed_db
+async def get_stats():
+    """Returns bot statistics, recomputed at most once every STATS_CACHE_TTL seconds."""
+    async with _stats_lock:
+        if _stats_cache["value"] is None or time.monotonic() >= _stats_cache["expires"]:
+            _stats_cache["value"] = await _compute_stats()
+            _stats_cache["expires"] = time.monotonic() + STATS_CACHE_TTL
+        return _stats_cache["value"]
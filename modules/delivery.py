@@ -0,0 +1,87 @@
+import gzip
+import io
+import logging
+from telethon import TelegramClient
+from telethon.tl.custom import Message
+from modules.api_client import SearchResult, create_paste
+from modules.metrics import SEARCH_STAGE_SECONDS
+from modules.config import DELIVERY_FILE_THRESHOLD, DELIVERY_FILE_GZIP
+
+logger = logging.getLogger("delivery")
+
+def summary_text(results: SearchResult) -> str:
+    """The "Found N result(s)" header shared by every delivery path."""
+    text = f"✅ **Found {results.hit_count} result(s)**"
+    if results.file_count:
+        text += f" in {results.file_count} file(s)"
+    if results.errors:
+        text += f"\n_({len(results.errors)} node error(s) included in the results)_"
+    if results.truncated:
+        text += "\n_(Output capped at your tier's size limit)_"
+    if results.over_budget:
+        text += "\n_(Stopped at your tier's search time budget, so results may be incomplete. This search was not counted against your limit.)_"
+    return text
+
+def results_file(results: SearchResult, compress: bool = DELIVERY_FILE_GZIP) -> io.BytesIO:
+    """Copies the result into a named in-memory file for Telethon, gzipping it on the way if asked."""
+    buffer = io.BytesIO()
+    if compress:
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as gz:
+            for chunk in results.iter_bytes():
+                gz.write(chunk)
+        buffer.name = "nexus_results.txt.gz"
+    else:
+        for chunk in results.iter_bytes():
+            buffer.write(chunk)
+        buffer.name = "nexus_results.txt"
+    buffer.seek(0)
+    return buffer
+
+async def send_results_file(client: TelegramClient, event: Message, results: SearchResult, caption: str) -> bool:
+    """Uploads the full result as a document replying to the user's /search message."""
+    try:
+        with SEARCH_STAGE_SECONDS.time(stage="upload"):
+            await client.send_file(
+                event.chat_id,
+                results_file(results),
+                caption=caption,
+                reply_to=event.id,
+                force_document=True
+            )
+        return True
+    except Exception as e:
+        logger.error(f"Result upload failed: {e}")
+        return False
+
+async def deliver_results(client: TelegramClient, event: Message, wait_msg: Message, results: SearchResult) -> bool:
+    """Delivers a non-empty result to the user. Returns False if every delivery path failed.
+
+    Results up to DELIVERY_FILE_THRESHOLD go to the pastebin as a burn-after-reading link, which keeps
+    the data out of the chat history. Larger results, or any result the pastebin could not take after
+    its retries, are uploaded straight to the chat as a document, so the user always gets everything.
+    """
+    found = summary_text(results)
+    if results.bytes <= DELIVERY_FILE_THRESHOLD:
+        # Always safely paste the output securely to prevent message limit issues
+        # and to obscure data from being logged directly in Telegram chat history.
+        await wait_msg.edit("📝 Generating a secure paste for your results...")
+        with SEARCH_STAGE_SECONDS.time(stage="paste"):
+            paste_url = await create_paste(results)
+        if paste_url:
+            await wait_msg.edit(
+                f"{found}\n\n"
+                f"🔗 [View Full Results Securely]({paste_url})\n\n"
+                f"⚠️ **Note:** This link will permanently self-destruct after it is opened once.",
+                link_preview=False
+            )
+            return True
+        note = "_(Pastebin upload failed, sending the results as a file instead)_"
+    else:
+        note = "_(Large result, sending it as a file)_"
+
+    await wait_msg.edit(f"{found}\n{note}")
+    if await send_results_file(client, event, results, found):
+        await wait_msg.edit(f"{found}\n\n📎 Full results are attached below.")
+        return True
+    await wait_msg.edit("⚠️ Could not deliver your results right now. Your search was not counted, please try again.")
+    return False
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from telethon import TelegramClient
+from modules.config import EXPIRY_BATCH_SIZE, EXPIRY_SEND_CONCURRENCY, EXPIRY_MAX_SLEEP
+from modules.database import users_col, user_cache
+
+logger = logging.getLogger("expiry")
+
+REMINDER_WINDOW = timedelta(days=1)
+
+class ExpiryScheduler:
+    """Sleeps until the next premium reminder or expiry is due, then handles everything due in batches.
+
+    Deadlines come from indexed (type, premium_expiry) queries, so wake-ups are on time instead of
+    hourly, and users are streamed from a cursor rather than loaded all at once.
+    """
+
+    def __init__(self, client: TelegramClient):
+        self.client = client
+        self._wake = asyncio.Event()
+
+    def wake(self):
+        """Re-evaluates the next deadline now, e.g. after premium was granted."""
+        self._wake.set()
+
+    async def _downgrade_expired(self, now: datetime):
+        cursor = users_col.find(
+            {"type": "premium", "premium_expiry": {"$lte": now}},
+            {"user_id": 1}
+        ).batch_size(EXPIRY_BATCH_SIZE)
+        batch = []
+        async for user in cursor:
+            batch.append(user["user_id"])
+            if len(batch) >= EXPIRY_BATCH_SIZE:
+                await self._downgrade_batch(batch, now)
+                batch = []
+        if batch:
+            await self._downgrade_batch(batch, now)
+
+    async def _downgrade_batch(self, user_ids: list[int], now: datetime):
+        # Re-check the expiry in the filter so a renewal that raced us is not undone
+        await users_col.update_many(
+            {"user_id": {"$in": user_ids}, "type": "premium", "premium_expiry": {"$lte": now}},
+            {"$set": {"type": "free"}}
+        )
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+        logger.info(f"Downgraded {len(user_ids)} expired premium user(s).")
+
+    async def _send_reminder(self, user_id: int, workers: asyncio.Semaphore):
+        async with workers:
+            try:
+                await self.client.send_message(
+                    user_id, 
+                    "⚠️ **Reminder:** Your Premium access will expire in less than 24 hours!\n"
+                    "Use `/account` to check your exact expiration time."
+                )
+            except Exception:
+                pass
+
+    async def _send_reminders(self, now: datetime):
+        cursor = users_col.find(
+            {
+                "type": "premium",
+                "premium_expiry": {"$gt": now, "$lte": now + REMINDER_WINDOW},
+                "notified_expiry": {"$ne": True}
+            },
+            {"user_id": 1}
+        ).batch_size(EXPIRY_BATCH_SIZE)
+        workers = asyncio.Semaphore(EXPIRY_SEND_CONCURRENCY)
+        batch = []
+        async for user in cursor:
+            batch.append(user["user_id"])
+            if len(batch) >= EXPIRY_BATCH_SIZE:
+                await self._remind_batch(batch, workers)
+                batch = []
+        if batch:
+            await self._remind_batch(batch, workers)
+
+    async def _remind_batch(self, user_ids: list[int], workers: asyncio.Semaphore):
+        await asyncio.gather(*(self._send_reminder(user_id, workers) for user_id in user_ids))
+        # Every attempted user is marked, so a blocked user can't keep the scheduler waking up
+        await users_col.bulk_write(
+            [UpdateOne({"user_id": user_id}, {"$set": {"notified_expiry": True}}) for user_id in user_ids],
+            ordered=False
+        )
+        for user_id in user_ids:
+            user_cache.apply(user_id, {"$set": {"notified_expiry": True}})
+
+    async def _next_deadline(self, now: datetime):
+        """Earliest of the next expiry and the next reminder (expiry - 24h) still to be sent."""
+        next_expiry, next_reminder = await asyncio.gather(
+            users_col.find_one(
+                {"type": "premium", "premium_expiry": {"$gt": now}},
+                {"premium_expiry": 1},
+                sort=[("premium_expiry", 1)]
+            ),
+            users_col.find_one(
+                {"type": "premium", "premium_expiry": {"$gt": now + REMINDER_WINDOW}, "notified_expiry": {"$ne": True}},
+                {"premium_expiry": 1},
+                sort=[("premium_expiry", 1)]
+            )
+        )
+        deadlines = []
+        if next_expiry:
+            deadlines.append(next_expiry["premium_expiry"])
+        if next_reminder:
+            deadlines.append(next_reminder["premium_expiry"] - REMINDER_WINDOW)
+        return min(deadlines) if deadlines else None
+
+    async def run(self):
+        _running.add(self)
+        try:
+            while True:
+                sleep_for = EXPIRY_MAX_SLEEP
+                # Cleared before reading Mongo, so a wake-up that lands during this pass triggers another one
+                self._wake.clear()
+                try:
+                    now = datetime.utcnow()
+                    await self._downgrade_expired(now)
+                    await self._send_reminders(now)
+
+                    deadline = await self._next_deadline(now)
+                    if deadline:
+                        sleep_for = min(max((deadline - datetime.utcnow()).total_seconds(), 1), EXPIRY_MAX_SLEEP)
+                except Exception as e:
+                    logger.error(f"Expiry scheduler error: {e}")
+
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=sleep_for)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            _running.discard(self)
+
+_running: set[ExpiryScheduler] = set()
+
+def wake_expiry_scheduler():
+    """Wakes the expiry scheduler running in this process, if any.
+
+    In cluster mode only the leader runs one; elsewhere this is a no-op and the leader picks the
+    change up by EXPIRY_MAX_SLEEP at the latest.
+    """
+    for scheduler in _running:
+        scheduler.wake()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from modules.config import (
+    NEXUS_API_URLS, NEXUS_SHARDS, NEXUS_API_KEY, HEALTH_CHECK_INTERVAL, HEALTH_STALE_AFTER,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, SEARCH_NODE_MAX_INFLIGHT,
+    ROUTING_EWMA_ALPHA, HEDGE_MIN_SAMPLES
+)
+from modules.http_client import get_http_client, host_slot
+
+logger = logging.getLogger("health")
+
+class CircuitBreaker:
+    """Per-node circuit breaker: closed -> open after repeated failures -> half-open trial -> closed."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Returns True if a request may be sent now. An open breaker lets one trial through after the reset timeout."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Frees the half-open trial slot of a request that was abandoned without an outcome (e.g. a lost hedge)."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit opened after {self.failures} failure(s).")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class NodeHealth:
+    """Cached health entry and routing statistics for one Nexus node (a replica of a shard)."""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.name = f"Node-{index+1}"
+        self.ready = None  # None until the first probe completes
+        self.state = "unknown"
+        self.last_error = ""
+        self.latency = 0.0
+        self.checked_at = 0.0
+        self.breaker = CircuitBreaker()
+        # Caps how many searches may stream from this node at once
+        self.slots = asyncio.Semaphore(SEARCH_NODE_MAX_INFLIGHT)
+        # Search time-to-first-byte: EWMA for routing, recent samples for the hedging p95
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.samples: deque[float] = deque(maxlen=100)
+
+    def usable(self) -> bool:
+        """A node is usable when it has not reported itself as not ready and its breaker is not open."""
+        return self.ready is not False and self.breaker.state != CircuitBreaker.OPEN
+
+    def record_latency(self, seconds: float):
+        self.samples.append(seconds)
+        if self.ewma_latency is None:
+            self.ewma_latency = seconds
+        else:
+            self.ewma_latency += ROUTING_EWMA_ALPHA * (seconds - self.ewma_latency)
+
+    def record_outcome(self, ok: bool):
+        self.error_rate += ROUTING_EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def score(self) -> float:
+        """Expected cost of routing a search here; lower is better. Unmeasured nodes fall back to the probe latency."""
+        latency = self.ewma_latency if self.ewma_latency is not None else self.latency
+        return latency / max(0.05, 1.0 - self.error_rate)
+
+    def p95(self):
+        """Recent p95 time-to-first-byte, or None until HEDGE_MIN_SAMPLES searches have been measured."""
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+class Shard:
+    """One data shard and the replicas that serve it."""
+
+    def __init__(self, index: int, name: str, replicas: list[NodeHealth]):
+        self.index = index
+        self.name = name
+        self.replicas = replicas
+
+    def ranked(self) -> list[NodeHealth]:
+        """Replicas not reported as down, fastest first by error-weighted EWMA latency, open breakers last."""
+        candidates = [node for node in self.replicas if node.ready is not False]
+        return sorted(candidates, key=lambda node: (node.breaker.state == CircuitBreaker.OPEN, node.score()))
+
+nodes = [NodeHealth(i, url) for i, url in enumerate(NEXUS_API_URLS)]
+_nodes_by_url = {node.url: node for node in nodes}
+shards = [Shard(i, name, [_nodes_by_url[url] for url in urls]) for i, (name, urls) in enumerate(NEXUS_SHARDS.items())]
+_last_poll = 0.0
+
+async def probe_node(node: NodeHealth):
+    """Hits a node's /status endpoint and updates its health entry and breaker."""
+    started = time.monotonic()
+    try:
+        async with host_slot(node.url):
+            res = await get_http_client().get(
+                f"{node.url}/status",
+                headers={"x-api-key": NEXUS_API_KEY},
+                timeout=5.0
+            )
+        if res.status_code == 200:
+            node.state = res.json().get("state")
+            node.ready = node.state == "done"
+            node.last_error = "" if node.ready else f"State: {node.state}"
+            node.breaker.record_success()
+        else:
+            node.ready = False
+            node.last_error = f"HTTP {res.status_code}"
+            node.breaker.record_failure()
+    except Exception as e:
+        node.ready = False
+        node.last_error = f"unreachable: {type(e).__name__} {e}"
+        node.breaker.record_failure()
+    node.latency = time.monotonic() - started
+    node.checked_at = time.time()
+
+async def poll_cluster():
+    """Probes every node concurrently and refreshes the health table."""
+    global _last_poll
+    await asyncio.gather(*(probe_node(node) for node in nodes))
+    _last_poll = time.monotonic()
+
+async def run_health_monitor():
+    """Background loop that keeps the health table fresh."""
+    while True:
+        try:
+            await poll_cluster()
+        except Exception as e:
+            logger.error(f"Health monitor error: {e}")
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+async def get_cluster_status() -> tuple[bool, str]:
+    """Returns (is_ready, message) from the cached health table, polling inline only if it is stale."""
+    if time.monotonic() - _last_poll > HEALTH_STALE_AFTER:
+        await poll_cluster()
+
+    # A shard is down only when none of its replicas is usable
+    down = [shard for shard in shards if not any(node.usable() for node in shard.replicas)]
+    if len(down) == len(shards):
+        return False, "; ".join(
+            f"{node.name} {node.last_error or 'circuit open'}" for shard in down for node in shard.replicas
+        ) + "."
+    if down:
+        names = ", ".join(shard.name for shard in down)
+        return True, f"{len(shards) - len(down)}/{len(shards)} shards ready ({names} unavailable)."
+    return True, "All API nodes are ready."
@@ -1,12 +1,12 @@
-import asyncio
-from telethon import events, TelegramClient
+from telethon import TelegramClient
 from telethon.tl.custom import Message
 from modules.config import ADMIN_ID
+from modules.router import router
 
 def register_help_handlers(client: TelegramClient):
 
-    @client.on(events.NewMessage(pattern=r'^/help'))
-    async def help_cmd(event: Message):
+    @router.command("help")
+    async def help_cmd(event: Message, args: str, user: None):
         user_id = event.sender_id
         
         user_text = (
@@ -14,6 +14,7 @@ def register_help_handlers(client: TelegramClient):
             "**👤 User Commands:**\n"
             "🔹 `/start` - Start the bot and get your referral link\n"
             "🔹 `/search <query>` - Search the Nexus database (Free: 10 lines/file, Premium: 50 lines/file)\n"
+            "🔹 `/cancel` - Cancel your running or queued search (it won't count against your limit)\n"
             "🔹 `/account` - View your tier, referral stats, and exact premium expiration time\n"
             "🔹 `/redeem <key>` - Redeem a premium access key\n"
             "🔹 `/stats` - View global bot statistics\n"
@@ -25,10 +26,13 @@ def register_help_handlers(client: TelegramClient):
 
         admin_text = (
             "\n\n**👑 Admin Commands:**\n"
-            "🔸 `/genkey <days>` - Generate a new premium key valid for X days\n"
-            "🔸 `/ban <user_id>` - Ban a user from using the bot\n"
-            "🔸 `/unban <user_id>` - Unban a previously banned user\n"
-            "🔸 `/broadcast <message>` - Send a message to all users safely"
+            "🔸 `/genkey <days> [count]` - Generate premium keys valid for X days (batches arrive as a file)\n"
+            "🔸 `/ban <user_id> [more IDs...]` - Ban users (or send/reply to a .txt file of IDs with /ban)\n"
+            "🔸 `/unban <user_id> [more IDs...]` - Unban users (also accepts a .txt file of IDs)\n"
+            "🔸 `/broadcast <message>` - Send a message to all users safely\n"
+            "🔸 `/bcstatus` - Show live progress of the running broadcast\n"
+            "🔸 `/bccancel` - Cancel the running broadcast\n"
+            "🔸 `/metrics` - Show per-stage search latency, node and database metrics"
         )
 
         # If the user is the admin, attach the admin commands to the help text
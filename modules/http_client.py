@@ -0,0 +1,77 @@
+import asyncio
+import importlib.util
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import httpx
+from modules.config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_PER_HOST_CONNECTIONS, HTTP2_ENABLED
+)
+
+logger = logging.getLogger("http_client")
+
+# One pooled client per process, shared by all Nexus and pastebin traffic
+_client: httpx.AsyncClient | None = None
+_host_slots: dict[str, asyncio.Semaphore] = {}
+
+async def init_http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """Creates the process-wide HTTP client. Called once from main alongside the Telethon client.
+
+    `transport` replaces the network layer (used by the benchmark's fake Nexus/pastebin servers).
+    """
+    global _client
+    if _client is not None:
+        return _client
+
+    http2 = HTTP2_ENABLED
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is not installed; falling back to HTTP/1.1.")
+        http2 = False
+
+    _client = httpx.AsyncClient(
+        http2=http2,
+        transport=transport,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    logger.info(f"HTTP client ready (pool={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE}, http2={http2})")
+    return _client
+
+async def close_http_client():
+    """Closes the shared client and drops its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it lazily if main has not done so yet."""
+    global _client
+    if _client is None:
+        # Fallback for scripts that use the API client without going through main
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    return _client
+
+@asynccontextmanager
+async def host_slot(url: str):
+    """Caps the number of concurrent requests to a single host (HTTP_PER_HOST_CONNECTIONS)."""
+    if HTTP_PER_HOST_CONNECTIONS <= 0:
+        yield
+        return
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(HTTP_PER_HOST_CONNECTIONS)
+    async with slot:
+        yield
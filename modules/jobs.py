@@ -0,0 +1,358 @@
+import asyncio
+import gzip
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from modules.api_client import SearchResult, fetch_search_results
+from modules.database import jobs_col, locks_col
+from modules.scheduler import SearchDropped
+from modules.config import (
+    JOB_MAX_RUNNING, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, JOB_MAX_RESULT_BYTES,
+    SCHEDULER_PREMIUM_HEAD_START, QUEUE_UPDATE_INTERVAL, SEARCH_PROGRESS_INTERVAL
+)
+
+logger = logging.getLogger("jobs")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _claimable(now: datetime) -> dict:
+    # Queued jobs, plus running jobs whose worker stopped renewing the lease
+    return {
+        "$or": [{"status": QUEUED}, {"status": RUNNING, "lease_until": {"$lt": now}}],
+        "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+        "cancel_requested": {"$ne": True}
+    }
+
+def _encode_result(results: SearchResult) -> dict:
+    payload = gzip.compress(results.getvalue(), compresslevel=6)
+    return {
+        "payload": payload,
+        "line_count": results.line_count,
+        "file_count": results.file_count,
+        "errors": results.errors,
+        "truncated": results.truncated,
+        "over_budget": results.over_budget,
+        "elapsed": results.elapsed
+    }
+
+def _decode_result(doc: dict) -> SearchResult:
+    result = SearchResult.from_bytes(
+        gzip.decompress(doc["payload"]), doc["line_count"], doc.get("errors"), doc.get("file_count", 0),
+        doc.get("truncated", False)
+    )
+    result.over_budget = doc.get("over_budget", False)
+    result.elapsed = doc.get("elapsed", 0.0)
+    return result
+
+class _Waiter:
+    def __init__(self, on_position, on_progress):
+        self.future = asyncio.get_running_loop().create_future()
+        self.on_position = on_position
+        self.on_progress = on_progress
+        self.position_at = 0.0
+        self.progress = None
+
+class JobClient:
+    """Frontend side of the job queue: enqueues /search jobs and waits for a worker to finish them.
+
+    A single poll loop watches every outstanding job with one query per JOB_POLL_INTERVAL and relays
+    queue positions and per-node progress to the waiting handlers.
+    """
+
+    def __init__(self, poll_interval: float, update_interval: float):
+        self.poll_interval = poll_interval
+        self.update_interval = update_interval
+        self.avg_duration = 30.0  # EWMA of job run time, used for queue ETAs
+        self._waiters: dict[str, _Waiter] = {}
+        self._task: asyncio.Task | None = None
+
+    async def run(self, user_id: int, premium: bool, query: str, limit: int, max_lines: int, max_bytes: int,
+                  budget: float | None = None, on_position=None, on_progress=None) -> SearchResult:
+        """Runs one search as a job. Raises SearchDropped if the job fails; cancelling cancels the job."""
+        job_id = uuid.uuid4().hex
+        await jobs_col.insert_one({
+            "_id": job_id,
+            "status": QUEUED,
+            # Same ordering as the in-process scheduler: premium jobs queue as if they arrived earlier
+            "priority": time.time() - (SCHEDULER_PREMIUM_HEAD_START if premium else 0),
+            "user_id": user_id,
+            "query": query,
+            "limit": limit,
+            "max_lines": max_lines,
+            "max_bytes": max_bytes,
+            "budget": budget,
+            "attempts": 0,
+            "cancel_requested": False,
+            "created_at": datetime.utcnow()
+        })
+        waiter = self._waiters[job_id] = _Waiter(on_position, on_progress)
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            # Drop a queued job outright; a running one is aborted (and removed) by its worker on the next lease renewal
+            try:
+                dropped = await jobs_col.delete_one({"_id": job_id, "status": QUEUED})
+                if not dropped.deleted_count:
+                    await jobs_col.update_one({"_id": job_id, "status": RUNNING}, {"$set": {"cancel_requested": True}})
+            except Exception as e:
+                logger.error(f"Failed to cancel job {job_id}: {e}")
+            raise
+        finally:
+            self._waiters.pop(job_id, None)
+
+    def _notify(self, callback, *args):
+        async def call():
+            try:
+                await callback(*args)
+            except Exception as e:
+                logger.debug(f"Job update failed: {e}")
+        if callback:
+            asyncio.create_task(call())
+
+    async def _poll(self):
+        try:
+            while self._waiters:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    await self._poll_once()
+                except Exception as e:
+                    logger.error(f"Job poll failed: {e}")
+        finally:
+            self._task = None
+
+    async def _poll_once(self):
+        docs = await jobs_col.find({"_id": {"$in": list(self._waiters)}}).to_list(length=None)
+        found = {doc["_id"]: doc for doc in docs}
+        finished = []
+        now = time.monotonic()
+        for job_id, waiter in list(self._waiters.items()):
+            if waiter.future.done():
+                continue
+            doc = found.get(job_id)
+            status = doc["status"] if doc else FAILED
+            if status == DONE:
+                finished.append(job_id)
+                if doc.get("started_at") and doc.get("finished_at"):
+                    duration = (doc["finished_at"] - doc["started_at"]).total_seconds()
+                    self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+                try:
+                    waiter.future.set_result(_decode_result(doc))
+                except Exception as e:
+                    waiter.future.set_exception(SearchDropped(f"⚠️ Could not read the search result: {e}"))
+            elif status == FAILED:
+                finished.append(job_id)
+                error = (doc or {}).get("error") or "The search job was lost. Please try again."
+                waiter.future.set_exception(SearchDropped(f"⚠️ {error}"))
+            elif status == RUNNING:
+                if doc["lease_until"] < datetime.utcnow() and doc.get("attempts", 0) >= JOB_MAX_ATTEMPTS:
+                    # Every worker that tried it died mid-run; give up instead of waiting forever
+                    finished.append(job_id)
+                    waiter.future.set_exception(SearchDropped("⚠️ The search worker stopped responding. Please try again."))
+                elif doc.get("progress") and doc["progress"] != waiter.progress:
+                    waiter.progress = doc["progress"]
+                    if waiter.on_progress:
+                        waiter.on_progress(doc["progress"])
+            elif status == QUEUED and waiter.on_position and now - waiter.position_at >= self.update_interval:
+                waiter.position_at = now
+                position = 1 + await jobs_col.count_documents({"status": QUEUED, "priority": {"$lt": doc["priority"]}})
+                eta = math.ceil(position / max(JOB_MAX_RUNNING, 1)) * self.avg_duration
+                self._notify(waiter.on_position, position, eta)
+        if finished:
+            await jobs_col.delete_many({"_id": {"$in": finished}})
+
+class JobWorker:
+    """Worker side of the job queue: claims jobs, runs them and stores the results for the frontend.
+
+    A job only starts once the worker holds one of JOB_MAX_RUNNING slot documents, which caps running
+    searches across every worker. Jobs and slots are leases renewed while the search runs; if a worker
+    dies, its slot frees up and its job is claimed again by another worker (up to JOB_MAX_ATTEMPTS).
+    """
+
+    def __init__(self, worker_id: str, concurrency: int):
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.slot_ids = [f"search-slot-{i}" for i in range(JOB_MAX_RUNNING)]
+        self._running: dict[str, asyncio.Task] = {}
+        self._draining = False
+        self._stopping = False
+
+    async def _ensure_slots(self):
+        await locks_col.bulk_write(
+            [UpdateOne({"_id": slot}, {"$setOnInsert": {"owner": None, "lease_until": _EPOCH}}, upsert=True) for slot in self.slot_ids],
+            ordered=False
+        )
+
+    async def _acquire_slot(self):
+        now = datetime.utcnow()
+        doc = await locks_col.find_one_and_update(
+            {"_id": {"$in": self.slot_ids}, "lease_until": {"$lt": now}},
+            {"$set": {"owner": self.worker_id, "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS)}}
+        )
+        return doc["_id"] if doc else None
+
+    async def _release_slot(self, slot: str):
+        await locks_col.update_one({"_id": slot, "owner": self.worker_id}, {"$set": {"owner": None, "lease_until": _EPOCH}})
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        return await jobs_col.find_one_and_update(
+            _claimable(now),
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": self.worker_id,
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _next_job(self):
+        """Claims the next job under a global slot. Returns (job, slot) or None when there is nothing to run."""
+        # Cheap existence check first, so an idle worker costs one query per poll
+        if not await jobs_col.find_one(_claimable(datetime.utcnow()), {"_id": 1}):
+            return None
+        slot = await self._acquire_slot()
+        if not slot:
+            return None
+        job = await self._claim()
+        if not job:
+            await self._release_slot(slot)
+            return None
+        return job, slot
+
+    async def run(self):
+        await self._ensure_slots()
+        local = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Worker {self.worker_id} is waiting for search jobs")
+        try:
+            while True:
+                await local.acquire()
+                if self._draining:
+                    local.release()
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+                    continue
+                try:
+                    claimed = await self._next_job()
+                except Exception as e:
+                    logger.error(f"Job claim failed: {e}")
+                    claimed = None
+                if not claimed:
+                    local.release()
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+                    continue
+                job, slot = claimed
+                task = asyncio.create_task(self._execute(job, slot))
+                self._running[job["_id"]] = task
+
+                def done(_task, job_id=job["_id"]):
+                    self._running.pop(job_id, None)
+                    local.release()
+                task.add_done_callback(done)
+        finally:
+            self._stopping = True
+            tasks = list(self._running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self, timeout: float):
+        """Stops claiming jobs and waits up to `timeout` seconds for the running ones.
+
+        Cancel `run()` afterwards; jobs still running at that point go back to the queue.
+        """
+        self._draining = True
+        if self._running:
+            logger.info(f"Waiting up to {timeout:g}s for {len(self._running)} running job(s)")
+            await asyncio.wait(list(self._running.values()), timeout=timeout)
+
+    async def _heartbeat(self, job_id: str, slot: str, fetch: asyncio.Task, progress: list, cancelled: asyncio.Event):
+        """Renews the job and slot leases, publishes progress, and aborts the fetch on /cancel or a lost lease."""
+        interval = min(JOB_LEASE_SECONDS / 3, SEARCH_PROGRESS_INTERVAL)
+        while True:
+            await asyncio.sleep(interval)
+            lease_until = datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+            update = {"lease_until": lease_until}
+            if progress:
+                update["progress"] = progress.pop()
+            try:
+                doc = await jobs_col.find_one_and_update(
+                    {"_id": job_id, "worker": self.worker_id},
+                    {"$set": update},
+                    projection={"cancel_requested": 1}
+                )
+                await locks_col.update_one({"_id": slot, "owner": self.worker_id}, {"$set": {"lease_until": lease_until}})
+            except Exception as e:
+                logger.error(f"Lease renewal for job {job_id} failed: {e}")
+                continue
+            if doc is None or doc.get("cancel_requested"):
+                # Cancelled by the user, or the job was handed to another worker after our lease lapsed
+                cancelled.set()
+                fetch.cancel()
+                return
+
+    async def _finish(self, job_id: str, fields: dict):
+        fields["finished_at"] = datetime.utcnow()
+        await jobs_col.update_one({"_id": job_id, "worker": self.worker_id}, {"$set": fields})
+
+    async def _execute(self, job: dict, slot: str):
+        job_id = job["_id"]
+        progress: list = []
+        cancelled = asyncio.Event()
+
+        def on_progress(state):
+            # Only the newest snapshot matters; the heartbeat writes it with the next lease renewal
+            progress[:] = [state.snapshot()]
+
+        fetch = asyncio.create_task(fetch_search_results(
+            job["query"], limit=job["limit"], max_lines=job["max_lines"], max_bytes=job["max_bytes"],
+            on_progress=on_progress, budget=job.get("budget")
+        ))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, slot, fetch, progress, cancelled))
+        try:
+            results = await fetch
+            try:
+                fields = await asyncio.to_thread(_encode_result, results)
+            finally:
+                results.close()
+            if len(fields["payload"]) > JOB_MAX_RESULT_BYTES:
+                await self._finish(job_id, {"status": FAILED, "error": "The result is too large to deliver. Please narrow your query."})
+            else:
+                await self._finish(job_id, {"status": DONE, **fields})
+        except asyncio.CancelledError:
+            if cancelled.is_set() and not self._stopping:
+                # Nobody is waiting for a cancelled job any more
+                await jobs_col.delete_one({"_id": job_id, "worker": self.worker_id})
+                return
+            # Worker shutdown: hand the job back without using up one of its attempts
+            fetch.cancel()
+            try:
+                await jobs_col.delete_one({"_id": job_id, "worker": self.worker_id, "cancel_requested": True})
+                await jobs_col.update_one(
+                    {"_id": job_id, "worker": self.worker_id},
+                    {"$set": {"status": QUEUED, "worker": None}, "$inc": {"attempts": -1}}
+                )
+            except Exception as e:
+                logger.error(f"Failed to requeue job {job_id}: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await self._finish(job_id, {"status": FAILED, "error": f"Search failed: {e}"})
+        finally:
+            heartbeat.cancel()
+            try:
+                await self._release_slot(slot)
+            except Exception as e:
+                logger.error(f"Failed to release {slot}: {e}")
+
+job_client = JobClient(poll_interval=JOB_POLL_INTERVAL, update_interval=QUEUE_UPDATE_INTERVAL)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from modules.database import locks_col
+
+logger = logging.getLogger("leader")
+
+class LeaderElection:
+    """Lease-based leader election on one document in the locks collection.
+
+    Every process runs this loop; whoever holds the lease runs `start_tasks()` (a callable returning
+    the singleton background tasks) and renews it every third of the lease. The tasks are cancelled as
+    soon as a renewal fails, so two processes never run them at once for longer than one renewal
+    interval (assuming roughly synchronised clocks).
+    """
+
+    def __init__(self, name: str, owner: str, lease: float, start_tasks):
+        self.name = name
+        self.owner = owner
+        self.lease = lease
+        self.start_tasks = start_tasks
+        self.is_leader = False
+
+    async def _try_acquire(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            await locks_col.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease
+            return False
+        except Exception as e:
+            logger.error(f"Leader lease renewal failed: {e}")
+            return False
+
+    async def run(self):
+        tasks: list[asyncio.Task] = []
+        try:
+            while True:
+                leader = await self._try_acquire()
+                if leader and not self.is_leader:
+                    logger.info(f"{self.owner} is now the leader for {self.name}")
+                    tasks = self.start_tasks()
+                elif not leader and self.is_leader:
+                    logger.warning(f"{self.owner} lost the {self.name} lease, stopping singleton tasks")
+                    for task in tasks:
+                        task.cancel()
+                    tasks = []
+                self.is_leader = leader
+                await asyncio.sleep(self.lease / 3)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.is_leader:
+                # Hand over right away instead of making the next leader wait out the lease
+                try:
+                    await locks_col.update_one(
+                        {"_id": self.name, "owner": self.owner},
+                        {"$set": {"lease_until": datetime(1970, 1, 1)}}
+                    )
+                except Exception:
+                    pass
+                self.is_leader = False
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from telethon import TelegramClient
+
+logger = logging.getLogger("lifecycle")
+
+class Lifecycle:
+    """Process-wide startup/shutdown state shared by main.py and the command router.
+
+    Commands that start long-running work (searches) are tracked while they run. On shutdown
+    `drain()` stops new ones from being accepted and gives the tracked ones time to finish.
+    """
+
+    def __init__(self):
+        self.accepting = True
+        # Filled once at startup (or on first use) so handlers never call get_me() per message
+        self.bot_username: str | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    @contextmanager
+    def track(self):
+        """Marks the current task as in-flight work that shutdown should wait for."""
+        task = asyncio.current_task()
+        self._inflight.add(task)
+        try:
+            yield
+        finally:
+            self._inflight.discard(task)
+
+    async def drain(self, timeout: float) -> int:
+        """Stops accepting new work and waits up to `timeout` seconds for in-flight work.
+
+        Whatever is still running afterwards is cancelled (searches refund their quota on the way
+        out). Returns the number of tasks that had to be cancelled.
+        """
+        self.accepting = False
+        pending = set(self._inflight)
+        if not pending:
+            return 0
+        logger.info(f"Waiting up to {timeout:g}s for {len(pending)} in-flight search(es)")
+        _, pending = await asyncio.wait(pending, timeout=timeout)
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} search(es) still running after the drain timeout")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+lifecycle = Lifecycle()
+
+async def get_bot_username(client: TelegramClient) -> str:
+    """The bot's @username, fetched from Telegram once per process."""
+    if lifecycle.bot_username is None:
+        me = await client.get_me()
+        lifecycle.bot_username = me.username
+    return lifecycle.bot_username
@@ -0,0 +1,183 @@
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+from modules.config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger("metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: list = []
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    """Monotonic counter with optional labels. `inc` is a dict update, cheap enough for the hot path."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labels
+        self.values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(tuple(str(labels[n]) for n in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}" for key, value in self.values.items()]
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time, so it costs nothing between scrapes."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        try:
+            return [f"{self.name} {self.callback():g}"]
+        except Exception:
+            return []
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labels
+        self.buckets = buckets
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self.values: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, **labels):
+        """Returns (count, mean, approximate p95) for one label set, using bucket upper bounds."""
+        entry = self.values.get(tuple(str(labels[n]) for n in self.labelnames))
+        if not entry or not entry[2]:
+            return 0, 0.0, 0.0
+        counts, total, count = entry
+        target, seen = 0.95 * count, 0
+        p95 = float("inf")
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            seen += bucket_count
+            if seen >= target:
+                p95 = bound
+                break
+        return count, total / count, p95
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render_all() -> str:
+    """Prometheus text exposition of every registered metric."""
+    out = []
+    for metric in _registry:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.render())
+    return "\n".join(out) + "\n"
+
+# Search pipeline
+SEARCH_STAGE_SECONDS = Histogram("nexus_search_stage_seconds", "Time spent in each /search stage.", ("stage",))
+SEARCHES_TOTAL = Counter("nexus_searches_total", "Completed /search requests by outcome.", ("outcome",))
+NODE_REQUEST_SECONDS = Histogram("nexus_node_request_seconds", "Duration of a search stream per node.", ("node",))
+NODE_LINES_TOTAL = Counter("nexus_node_lines_total", "Result lines streamed per node.", ("node",))
+NODE_BYTES_TOTAL = Counter("nexus_node_bytes_total", "Result bytes streamed per node.", ("node",))
+NODE_ERRORS_TOTAL = Counter("nexus_node_errors_total", "Node failures by kind (http, backend, timeout, budget, exception, skipped).", ("node", "kind"))
+HEDGED_REQUESTS_TOTAL = Counter("nexus_hedged_requests_total", "Hedged shard requests by which replica answered first (primary, hedge, none).", ("shard", "winner"))
+
+# Command router
+COMMANDS_TOTAL = Counter("nexus_commands_total", "Dispatched commands by name and outcome (ok, flood, denied, usage, draining, banned).", ("command", "outcome"))
+
+# Database
+DB_CALL_SECONDS = Histogram("nexus_db_call_seconds", "Duration of database helper calls.", ("op",))
+
+def timed_db(fn):
+    """Decorator recording an async database helper's duration under its function name."""
+    op = fn.__name__
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - started, op=op)
+    return wrapper
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        body = render_all().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+            b"Connection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server():
+    """Serves the Prometheus endpoint on METRICS_HOST:METRICS_PORT. Returns None when disabled (port 0).
+
+    A bind failure (e.g. another frontend or worker on this host already has the port) is logged and
+    the process runs on without an endpoint; give each process its own METRICS_PORT to scrape them all.
+    """
+    if METRICS_PORT <= 0:
+        return None
+    try:
+        server = await asyncio.start_server(_handle_scrape, METRICS_HOST, METRICS_PORT)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint disabled, could not bind {METRICS_HOST}:{METRICS_PORT}: {e}")
+        return None
+    logger.info(f"Metrics endpoint listening on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
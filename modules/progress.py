@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+from telethon.tl.custom import Message
+
+logger = logging.getLogger("progress")
+
+class ThrottledEditor:
+    """Keeps a message in sync with changing text while editing it at most once every `interval` seconds.
+
+    `update()` never blocks: the newest text is remembered and written by a background edit, so a burst
+    of updates costs one edit and stays well under Telegram's flood limits.
+    """
+
+    def __init__(self, message: Message, interval: float):
+        self.message = message
+        self.interval = interval
+        self._text = None
+        self._shown = None
+        self._last_edit = 0.0
+        self._task: asyncio.Task | None = None
+
+    def update(self, text: str):
+        self._text = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        try:
+            await asyncio.sleep(max(0.0, self._last_edit + self.interval - time.monotonic()))
+            text = self._text
+            if text != self._shown:
+                self._last_edit = time.monotonic()
+                self._shown = text
+                await self.message.edit(text)
+        except Exception as e:
+            logger.debug(f"Progress edit failed: {e}")
+        finally:
+            self._task = None
+            # Text that changed during the edit gets its own (throttled) edit
+            if self._text != self._shown:
+                self.update(self._text)
+
+    def close(self):
+        """Drops any pending edit so it cannot overwrite the caller's final message."""
+        self._text = self._shown
+        if self._task:
+            self._task.cancel()
+            self._task = None
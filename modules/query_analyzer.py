@@ -0,0 +1,220 @@
+import random
+import re
+import time
+from collections import OrderedDict
+from modules.cache import normalize_query
+from modules.config import (
+    QUERY_MIN_LITERAL, QUERY_MAX_LENGTH, QUERY_REGEX_FREE, QUERY_BUDGET_FREE, QUERY_BUDGET_PREMIUM,
+    QUERY_COST_TTL, QUERY_COST_MAX_ENTRIES, QUERY_COST_RESAMPLE
+)
+
+# Characters with a meaning in ripgrep's regex syntax, which the nodes run the query through
+_META = frozenset(".^$*+?()[]{}|\\")
+# A quantified group that itself contains a quantifier, e.g. (a+)+ or (\w*x)*
+_NESTED_QUANTIFIER = re.compile(r"\([^()]*[+*}][^()]*\)[+*{]")
+# Huge counted repetitions blow up ripgrep's compiled regex size, e.g. a{1000}
+_BIG_REPEAT = re.compile(r"\{\s*\d{4,}|\{\s*\d*\s*,\s*\d{4,}")
+# Unsupported by ripgrep's default engine; rejected here instead of as an error from every node
+_BACKREF_OR_LOOKAROUND = re.compile(r"\\[1-9]|\(\?<?[=!]")
+# Plain dotted strings such as hosts, IPs and emails (10.0.0.1, mail.example.com:443): searched literally
+_PLAIN_DOTTED = re.compile(r"[\w@-]+(?:\.[\w@-]+)+(?::\d+)?")
+
+class QueryRejected(Exception):
+    """Raised by `analyze` when a query is refused; `reason` is the user-facing message."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+def escape_pattern(query: str) -> str:
+    """Backslash-escapes regex metacharacters so ripgrep searches for the text literally."""
+    return "".join("\\" + char if char in _META else char for char in query)
+
+def _skip_class(pattern: str, i: int) -> int:
+    """Index just past the character class opening at `i` (a `]` right after `[` or `[^` is literal)."""
+    j = i + 1
+    if j < len(pattern) and pattern[j] == "^":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    while j < len(pattern) and pattern[j] != "]":
+        j += 2 if pattern[j] == "\\" else 1
+    return min(j + 1, len(pattern))
+
+def _skip_group(pattern: str, i: int) -> int:
+    """Index just past the group opening at `i`, skipping escapes and character classes."""
+    depth = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            i = _skip_class(pattern, i)
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(pattern)
+
+def _split_alternatives(pattern: str) -> list[str]:
+    """Splits on the top-level `|` only; alternations inside a group stay part of that group."""
+    parts, start, i = [], 0, 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\":
+            i += 2
+        elif char == "[":
+            i = _skip_class(pattern, i)
+        elif char == "(":
+            i = _skip_group(pattern, i)
+        elif char == "|":
+            parts.append(pattern[start:i])
+            i += 1
+            start = i
+        else:
+            i += 1
+    parts.append(pattern[start:])
+    return parts
+
+def _longest_literal(pattern: str) -> int:
+    """Length of the longest run of characters every match must contain literally.
+
+    ripgrep prefilters lines on such literals; a pattern without a decent one has to run the regex
+    engine over every line of the dataset, which is what makes it expensive.
+    """
+    longest = run = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            # \. \( ... are literals; \d \w \s \b ... are classes or assertions
+            literal = not pattern[i + 1].isalnum()
+            i += 2
+        elif char == "[":
+            # A character class matches one of several characters: not a literal
+            literal = False
+            i = _skip_class(pattern, i)
+        elif char == "(":
+            # A group is one atom that breaks the run; its contents may be alternatives or optional
+            literal = False
+            i = _skip_group(pattern, i)
+        else:
+            literal = char not in _META
+            i += 1
+        # An optional or counted atom may be absent from the match
+        if i < len(pattern) and pattern[i] in "*?{":
+            literal = False
+        if literal:
+            run += 1
+            longest = max(longest, run)
+        else:
+            run = 0
+    return longest
+
+class QueryPlan:
+    """An analyzed query: the pattern to send, its tier and budget, and the estimated run time (None if unknown)."""
+
+    def __init__(self, query: str, premium: bool, budget: float, estimate: float | None):
+        self.query = query
+        self.premium = premium
+        self.budget = budget
+        self.estimate = estimate
+
+    @property
+    def too_expensive(self) -> bool:
+        return self.estimate is not None and self.estimate >= self.budget
+
+class QueryAnalyzer:
+    """Local cost guard in front of the cluster.
+
+    `analyze` normalizes a query, escapes it (free tier, unless QUERY_REGEX_FREE) or checks it for
+    pathological regex constructs, requires QUERY_MIN_LITERAL literal characters, and estimates its
+    cost from the query's own past timings in the same tier (an EWMA forgotten `ttl` seconds after its
+    last sample). Queries that have not run recently have no estimate and are never refused on cost.
+
+    A run stopped by its budget only shows that the query costs at least that much, so it can raise the
+    estimate but never lower it. A `resample` fraction of refused queries still runs so an estimate that
+    no longer holds is corrected instead of locking the query out.
+    """
+
+    def __init__(self, min_literal: int, max_length: int, regex_free: bool, budgets: dict[bool, float],
+                 ttl: float, max_entries: int, resample: float):
+        self.min_literal = min_literal
+        self.max_length = max_length
+        self.regex_free = regex_free
+        self.budgets = budgets
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.resample = resample
+        # (premium, pattern) -> (recorded at (monotonic), EWMA seconds)
+        self._queries: OrderedDict[tuple[bool, str], tuple[float, float]] = OrderedDict()
+
+    def analyze(self, query: str, premium: bool) -> QueryPlan:
+        text = normalize_query(query)
+        if len(text) > self.max_length:
+            raise QueryRejected(f"⚠️ Your query is too long (max {self.max_length} characters).")
+
+        if premium or self.regex_free:
+            if _BACKREF_OR_LOOKAROUND.search(text):
+                raise QueryRejected("⚠️ Backreferences and lookaround are not supported in search patterns.")
+            if _NESTED_QUANTIFIER.search(text) or _BIG_REPEAT.search(text):
+                raise QueryRejected("⚠️ That pattern is too expensive to run (nested or very large repetitions). Please simplify it.")
+            if _PLAIN_DOTTED.fullmatch(text):
+                # Every `.` would break the literal run, and a host or IP is meant literally anyway
+                pattern = escape_pattern(text)
+                literal = len(text)
+            else:
+                pattern = text
+                literal = min(_longest_literal(part) for part in _split_alternatives(text))
+            if literal < self.min_literal:
+                raise QueryRejected(
+                    f"⚠️ Your query is too broad. Every alternative needs at least {self.min_literal} "
+                    f"consecutive plain characters."
+                )
+        else:
+            pattern = escape_pattern(text)
+            literal = len(text)
+            if literal < self.min_literal:
+                raise QueryRejected(f"⚠️ Your query is too short. Please use at least {self.min_literal} characters.")
+
+        budget = self.budgets[premium]
+        estimate = self.estimate(pattern, premium)
+        if estimate is not None and estimate >= budget and random.random() < self.resample:
+            estimate = None
+        return QueryPlan(pattern, premium, budget, estimate)
+
+    def estimate(self, pattern: str, premium: bool) -> float | None:
+        entry = self._queries.get((premium, pattern))
+        if entry:
+            if time.monotonic() - entry[0] < self.ttl:
+                return entry[1]
+            del self._queries[(premium, pattern)]
+        return None
+
+    def record(self, plan: QueryPlan, seconds: float, over_budget: bool = False):
+        """Feeds back a fresh search's fetch time. `over_budget` marks a run cut off by its budget (a lower bound)."""
+        key = (plan.premium, plan.query)
+        entry = self._queries.pop(key, None)
+        if over_budget:
+            # Censored: the query cost at least `seconds`, so never lower what is already known
+            average = seconds if entry is None else max(entry[1], seconds)
+        else:
+            average = seconds if entry is None else 0.5 * entry[1] + 0.5 * seconds
+        self._queries[key] = (time.monotonic(), average)
+        while len(self._queries) > self.max_entries:
+            self._queries.popitem(last=False)
+
+query_analyzer = QueryAnalyzer(
+    min_literal=QUERY_MIN_LITERAL,
+    max_length=QUERY_MAX_LENGTH,
+    regex_free=QUERY_REGEX_FREE,
+    budgets={False: QUERY_BUDGET_FREE, True: QUERY_BUDGET_PREMIUM},
+    ttl=QUERY_COST_TTL,
+    max_entries=QUERY_COST_MAX_ENTRIES,
+    resample=QUERY_COST_RESAMPLE
+)
@@ -0,0 +1,150 @@
+import logging
+import re
+import time
+from telethon import events, TelegramClient
+from telethon.tl.custom import Message
+from modules.database import get_user, create_user
+from modules.metrics import COMMANDS_TOTAL
+from modules.lifecycle import lifecycle
+from modules.config import ADMIN_ID, FLOOD_RATE, FLOOD_BURST, FLOOD_MAX_TRACKED
+
+logger = logging.getLogger("router")
+
+# "/cmd", "/cmd@botname" and "/cmd args...", parsed once per message
+_COMMAND_RE = re.compile(r"/([A-Za-z0-9_]+)(?:@([A-Za-z0-9_]+))?(?:\s+(.*))?", re.S)
+
+class Route:
+    """One command in the routing table."""
+
+    def __init__(self, name: str, handler, args: str | None, admin: bool, load_user: bool, create: bool,
+                 usage: str | None, tracked: bool):
+        self.name = name
+        self.handler = handler
+        self.args = re.compile(args, re.S) if args else None
+        self.admin = admin
+        self.load_user = load_user
+        self.create = create
+        self.usage = usage
+        self.tracked = tracked
+
+class FloodGuard:
+    """Per-user token buckets kept in memory, checked before any database or network work.
+
+    Each user may send `burst` commands at once and then `rate` per second. Buckets that have refilled
+    are forgotten once more than `max_tracked` users are being tracked, so memory stays bounded.
+    """
+
+    def __init__(self, rate: float, burst: int, max_tracked: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_tracked = max_tracked
+        # user_id -> [tokens, last refill (monotonic), warned]
+        self._buckets: dict[int, list] = {}
+
+    def check(self, user_id: int) -> tuple[bool, bool]:
+        """Takes one token. Returns (allowed, warn); `warn` is set only on the first drop of a flood."""
+        if self.rate <= 0:
+            return True, False
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tracked:
+                self._prune(now)
+            bucket = self._buckets[user_id] = [float(self.burst), now, False]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True, False
+        warn = not bucket[2]
+        bucket[2] = True
+        return False, warn
+
+    def _prune(self, now: float):
+        full = [uid for uid, (tokens, stamp, _) in self._buckets.items() if tokens + (now - stamp) * self.rate >= self.burst]
+        for uid in full:
+            del self._buckets[uid]
+
+class CommandRouter:
+    """Single NewMessage handler that parses a command once and dispatches it through a table.
+
+    Before a handler runs, the router drops flooding users (no I/O at all), enforces admin-only
+    commands, validates the arguments and, for routes that need it, loads the user document once and
+    rejects banned users. Handlers are called as `handler(event, args, user)`. `tracked` routes are
+    refused while the bot shuts down, and shutdown waits for the running ones (see Lifecycle.drain).
+    """
+
+    def __init__(self, flood: FloodGuard):
+        self.flood = flood
+        self.routes: dict[str, Route] = {}
+
+    def command(self, name: str, args: str | None = None, admin: bool = False, load_user: bool = False,
+                create: bool = False, usage: str | None = None, tracked: bool = False):
+        """Registers the decorated coroutine for `/name`. `args` is a regex the whole argument string must match."""
+        def decorator(handler):
+            self.routes[name] = Route(name, handler, args, admin, load_user, create, usage, tracked)
+            return handler
+        return decorator
+
+    def attach(self, client: TelegramClient):
+        client.add_event_handler(self.dispatch, events.NewMessage())
+
+    async def dispatch(self, event: Message):
+        text = event.raw_text
+        if not text or text[0] != "/":
+            return
+        match = _COMMAND_RE.match(text)
+        if not match:
+            return
+        name, mention, args = match.group(1).lower(), match.group(2), (match.group(3) or "").strip()
+        # Once the bot's own username is known, commands addressed to other bots are ignored
+        if mention and lifecycle.bot_username and mention.lower() != lifecycle.bot_username.lower():
+            return
+        route = self.routes.get(name)
+        if route is None:
+            return
+
+        user_id = event.sender_id
+        is_admin = user_id == ADMIN_ID
+        if not is_admin:
+            allowed, warn = self.flood.check(user_id)
+            if not allowed:
+                COMMANDS_TOTAL.inc(command=name, outcome="flood")
+                if warn:
+                    logger.debug(f"Dropping commands from flooding user {user_id}")
+                    await event.reply("⏳ You're sending commands too fast. Please slow down.")
+                return
+            if route.admin:
+                COMMANDS_TOTAL.inc(command=name, outcome="denied")
+                return
+
+        if route.args and not route.args.fullmatch(args):
+            COMMANDS_TOTAL.inc(command=name, outcome="usage")
+            if route.usage:
+                await event.reply(f"ℹ️ Usage: `{route.usage}`")
+            return
+
+        if route.tracked and not lifecycle.accepting:
+            COMMANDS_TOTAL.inc(command=name, outcome="draining")
+            return await event.reply("🔧 The bot is restarting. Please try again in a minute.")
+
+        user = None
+        if route.load_user:
+            user = await get_user(user_id)
+            if user is None and route.create:
+                user, _ = await create_user(user_id)
+            if user and user.get("is_banned"):
+                COMMANDS_TOTAL.inc(command=name, outcome="banned")
+                return await event.reply("🚫 You are banned from using this bot.")
+
+        COMMANDS_TOTAL.inc(command=name, outcome="ok")
+        if route.tracked:
+            with lifecycle.track():
+                await route.handler(event, args, user)
+        else:
+            await route.handler(event, args, user)
+
+# Shared routing table; the register_*_handlers functions add their commands to it
+router = CommandRouter(FloodGuard(FLOOD_RATE, FLOOD_BURST, FLOOD_MAX_TRACKED))
@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+logger = logging.getLogger("scheduler")
+
+class SearchDropped(Exception):
+    """Raised by `acquire` when a queued job is dropped before it runs."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class SearchTicket:
+    """One user's place in the search queue."""
+
+    def __init__(self, user_id: int, premium: bool, key: float, seq: int):
+        self.user_id = user_id
+        self.premium = premium
+        self.key = key
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted: asyncio.Future | None = None
+        self.started_at = 0.0
+        self.running = False
+        self.done = False
+
+    def __lt__(self, other: "SearchTicket") -> bool:
+        return (self.key, self.seq) < (other.key, other.seq)
+
+class SearchScheduler:
+    """Tiered, fair search scheduler.
+
+    Tickets are ordered by enqueue time, with premium tickets starting `premium_head_start`
+    seconds ahead, so premium users jump the queue but free users can never be starved.
+    Each user may hold one ticket at a time and at most `max_concurrent` searches run at once.
+    """
+
+    def __init__(self, max_concurrent: int, premium_head_start: float, update_interval: float):
+        self.max_concurrent = max_concurrent
+        self.premium_head_start = premium_head_start
+        self.update_interval = update_interval
+        self.running = 0
+        self.avg_duration = 30.0  # EWMA of search run time, used for queue ETAs
+        self._heap: list[SearchTicket] = []
+        self._users: dict[int, SearchTicket] = {}
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for ticket in self._heap if not ticket.done)
+
+    def submit(self, user_id: int, premium: bool) -> SearchTicket | None:
+        """Reserves the user's single search slot. Returns None if they already have a search in progress."""
+        if user_id in self._users:
+            return None
+        key = time.monotonic() - (self.premium_head_start if premium else 0)
+        ticket = SearchTicket(user_id, premium, key, next(self._seq))
+        self._users[user_id] = ticket
+        return ticket
+
+    def position(self, ticket: SearchTicket) -> int:
+        """1-based position of a waiting ticket in the queue."""
+        return 1 + sum(1 for other in self._heap if not other.done and other < ticket)
+
+    def eta(self, position: int) -> float:
+        return math.ceil(position / max(self.max_concurrent, 1)) * self.avg_duration
+
+    def _dispatch(self):
+        while self._heap and self.running < self.max_concurrent:
+            ticket = heapq.heappop(self._heap)
+            if ticket.done:
+                continue
+            self.running += 1
+            ticket.running = True
+            ticket.started_at = time.monotonic()
+            ticket.granted.set_result(True)
+
+    async def acquire(self, ticket: SearchTicket, on_update=None, precheck=None):
+        """Waits for the ticket's turn.
+
+        `on_update(position, eta)` is awaited at most every `update_interval` seconds while the
+        position changes. `precheck()` runs once the turn comes up and may return a reason string
+        to drop the job (e.g. the user was banned while waiting), in which case the slot is freed
+        and SearchDropped is raised.
+        """
+        ticket.granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, ticket)
+        self._dispatch()
+
+        try:
+            last_position = None
+            while not ticket.granted.done():
+                position = self.position(ticket)
+                if on_update and position != last_position:
+                    last_position = position
+                    try:
+                        await on_update(position, self.eta(position))
+                    except Exception as e:
+                        logger.debug(f"Queue update failed: {e}")
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.granted), timeout=self.update_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            if precheck:
+                reason = await precheck()
+                if reason:
+                    raise SearchDropped(reason)
+        except BaseException:
+            # Never leak a queue entry or a running slot if the waiter is cancelled
+            self.release(ticket)
+            raise
+
+    def release_slot(self, ticket: SearchTicket):
+        """Frees the ticket's concurrency slot once its backend work is done, keeping the user's reservation."""
+        if not ticket.running:
+            return
+        ticket.running = False
+        self.running -= 1
+        duration = time.monotonic() - ticket.started_at
+        self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+        self._dispatch()
+
+    def release(self, ticket: SearchTicket):
+        """Frees the user's reservation and, if the ticket is still running, its concurrency slot."""
+        if ticket.done:
+            return
+        ticket.done = True
+        if self._users.get(ticket.user_id) is ticket:
+            del self._users[ticket.user_id]
+        self.release_slot(ticket)
+        self._dispatch()
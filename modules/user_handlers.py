@@ -1,77 +1,86 @@
 import asyncio
-from datetime import datetime, timedelta
-from telethon import events, TelegramClient
+import time
+from datetime import datetime
+from telethon import TelegramClient
 from telethon.tl.custom import Message
 from modules.database import (
-    get_user, create_user, handle_referral, check_and_reset_limits, 
-    increment_search_usage, get_stats, keys_col, users_col
+    get_user, create_user, handle_referral, consume_search_quota, refund_search_quota,
+    record_search_stats, redeem_key, get_stats, user_cache
+)
+from modules.api_client import check_api_status, fetch_search_results
+from modules.query_analyzer import query_analyzer, QueryRejected
+from modules.progress import ThrottledEditor
+from modules.delivery import deliver_results
+from modules.router import router
+from modules.lifecycle import get_bot_username
+from modules.cache import search_cache
+from modules.scheduler import SearchScheduler, SearchDropped
+from modules.expiry import ExpiryScheduler, wake_expiry_scheduler
+from modules.jobs import job_client
+from modules.metrics import Gauge, SEARCH_STAGE_SECONDS, SEARCHES_TOTAL
+from modules.config import (
+    ADMIN_ID, SEARCH_MAX_LINES_FREE, SEARCH_MAX_LINES_PREMIUM,
+    SEARCH_MAX_BYTES_FREE, SEARCH_MAX_BYTES_PREMIUM,
+    SEARCH_MAX_CONCURRENT, SCHEDULER_PREMIUM_HEAD_START, QUEUE_UPDATE_INTERVAL, SEARCH_PROGRESS_INTERVAL,
+    JOB_QUEUE_ENABLED
 )
-from modules.api_client import check_api_status, fetch_search_results, create_paste
 
-# Global queue semaphore: Allows up to 10 concurrent searches to prevent overloading the backend.
-search_queue_semaphore = asyncio.Semaphore(10)
+# Global search scheduler: tiered priority queue with per-user fairness, replacing the old plain semaphore.
+search_scheduler = SearchScheduler(
+    max_concurrent=SEARCH_MAX_CONCURRENT,
+    premium_head_start=SCHEDULER_PREMIUM_HEAD_START,
+    update_interval=QUEUE_UPDATE_INTERVAL
+)
 
-async def check_premium_expiries(client: TelegramClient):
-    """Background task to remind users 24h before premium expires."""
-    while True:
-        try:
-            now = datetime.utcnow()
-            alert_window = now + timedelta(days=1)
-            
-            # Find premium users expiring in < 24h who haven't been notified yet
-            expiring_users = await users_col.find({
-                "type": "premium",
-                "premium_expiry": {"$gt": now, "$lte": alert_window},
-                "notified_expiry": {"$ne": True}
-            }).to_list(length=None)
-            
-            for user in expiring_users:
-                try:
-                    await client.send_message(
-                        user["user_id"], 
-                        "⚠️ **Reminder:** Your Premium access will expire in less than 24 hours!\n"
-                        "Use `/account` to check your exact expiration time."
-                    )
-                    # Mark as notified
-                    await users_col.update_one(
-                        {"user_id": user["user_id"]},
-                        {"$set": {"notified_expiry": True}}
-                    )
-                except Exception:
-                    pass
-                await asyncio.sleep(1)  # Spread out messages safely
-        except Exception:
-            pass
-        
-        await asyncio.sleep(3600)  # Check every hour
+# user_id -> the task running that user's search, so /cancel can abort it
+active_searches: dict[int, asyncio.Task] = {}
+
+_PROGRESS_ICONS = {"pending": "⏳", "done": "✅", "failed": "❌", "timeout": "⌛", "skipped": "⏭"}
+
+def progress_text(snapshot: list) -> str:
+    """Live per-node status shown in the wait message while a search streams (see SearchProgress.snapshot)."""
+    finished = sum(1 for _, state, _ in snapshot if state != "pending")
+    lines = [f"🔎 Searching the cluster... **{finished}/{len(snapshot)}** node(s) finished\n"]
+    for name, state, hits in snapshot:
+        suffix = " so far" if state == "pending" else ""
+        lines.append(f"{_PROGRESS_ICONS.get(state, '•')} {name}: {hits} hit(s){suffix}")
+    lines.append("\nSend /cancel to stop this search.")
+    return "\n".join(lines)
+
+Gauge("nexus_search_queue_depth", "Searches waiting for a scheduler slot.", lambda: search_scheduler.queued)
+Gauge("nexus_search_running", "Searches currently holding a scheduler slot.", lambda: search_scheduler.running)
+Gauge("nexus_result_cache_hit_ratio", "Result cache hit ratio since start.", lambda: search_cache.stats()["hit_rate"])
+Gauge("nexus_user_cache_hit_ratio", "User cache hit ratio since start.", lambda: user_cache.stats()["hit_rate"])
 
 def register_user_handlers(client: TelegramClient):
     
-    # Start the background checker
-    asyncio.create_task(check_premium_expiries(client))
+    # Start the background expiry scheduler (reminders + downgrades); in cluster mode the leader runs it
+    if not JOB_QUEUE_ENABLED:
+        asyncio.create_task(ExpiryScheduler(client).run())
 
-    @client.on(events.NewMessage(pattern=r'^/start(?: (.*))?'))
-    async def start_cmd(event: Message):
+    @router.command("start", load_user=True)
+    async def start_cmd(event: Message, args: str, user: dict | None):
         user_id = event.sender_id
-        user = await get_user(user_id)
         
         if not user:
             # Handle referral logic
-            ref_id_str = event.pattern_match.group(1)
+            ref_id_str = args
             referrer_id = None
             if ref_id_str and ref_id_str.isdigit() and int(ref_id_str) != user_id:
                 referrer_id = int(ref_id_str)
+
+            # Only the /start that actually inserts the user credits the referral, so racing ones can't double count
+            _, created = await create_user(user_id, referrer_id)
+            if created and referrer_id:
                 reward_earned = await handle_referral(referrer_id)
                 if reward_earned:
+                    wake_expiry_scheduler()
                     try:
                         await client.send_message(referrer_id, "🎉 Congratulations! 5 users joined via your link. You've earned 1 week of Premium!")
                     except:
                         pass
             
-            await create_user(user_id, referrer_id)
-            
-        bot_me = await client.get_me()
-        ref_link = f"https://t.me/{bot_me.username}?start={user_id}"
+        ref_link = f"https://t.me/{await get_bot_username(client)}?start={user_id}"
         await event.reply(
             f"Welcome to Nexus Search Bot!\n\n"
             f"🔍 Use `/search <query>` to find data.\n"
@@ -79,112 +88,180 @@ def register_user_handlers(client: TelegramClient):
             f"(5 Referrals = 1 Week Premium)"
         )
 
-    @client.on(events.NewMessage(pattern=r'^/search (.*)'))
-    async def search_cmd(event: Message):
+    @router.command("search", args=r".+", load_user=True, create=True, usage="/search <query>", tracked=True)
+    async def search_cmd(event: Message, query: str, user: dict):
         user_id = event.sender_id
-        query = event.pattern_match.group(1).strip()
-        
-        user = await get_user(user_id)
-        if not user:
-            user = await create_user(user_id)
-            
-        if user.get("is_banned"):
-            return await event.reply("🚫 You are banned from using this bot.")
-            
-        # Check premium expiry status
-        if user['type'] == 'premium':
-            if user['premium_expiry'] and user['premium_expiry'] < datetime.utcnow():
-                await users_col.update_one({"user_id": user_id}, {"$set": {"type": "free"}})
-                user['type'] = 'free'
-
-        # Check Limits
-        limit = 5 if user['type'] == 'premium' else 1
-        searches_today = await check_and_reset_limits(user)
-        
-        if searches_today >= limit:
-            return await event.reply(f"⚠️ You have reached your daily limit of {limit} search(es). Please wait 24 hours or upgrade to premium.")
 
-        # Check API Status
-        is_ready, status_msg = await check_api_status()
-        if not is_ready:
-            return await event.reply(f"⏳ Backend is not ready. {status_msg} Please try again in a minute.")
+        # Determine how many matches per file to request, and the output caps, based on tier.
+        # Expired premium is downgraded by the expiry scheduler; until then it simply counts as free.
+        is_premium = user['type'] == 'premium' and not (
+            user.get('premium_expiry') and user['premium_expiry'] < datetime.utcnow()
+        )
+        limit = 5 if is_premium else 1
+        result_limit = 50 if is_premium else 10
+        max_lines = SEARCH_MAX_LINES_PREMIUM if is_premium else SEARCH_MAX_LINES_FREE
+        max_bytes = SEARCH_MAX_BYTES_PREMIUM if is_premium else SEARCH_MAX_BYTES_FREE
+
+        # Normalize the query and refuse patterns that would tie up the cluster, before anything is charged
+        try:
+            plan = query_analyzer.analyze(query, is_premium)
+        except QueryRejected as rejected:
+            SEARCHES_TOTAL.inc(outcome="rejected_query")
+            return await event.reply(rejected.reason)
 
-        # Determine how many matches per file to request based on tier
-        result_limit = 50 if user['type'] == 'premium' else 10
+        # Each user may have one search queued or running at a time
+        ticket = search_scheduler.submit(user_id, is_premium)
+        if ticket is None:
+            return await event.reply("⏳ You already have a search in progress. Please wait for it to finish.")
 
-        wait_msg = await event.reply("🔎 You have been added to the queue. Processing...")
+        charged = delivered = False
+        outcome = "aborted"
+        started = time.perf_counter()
+        try:
+            # Check Limits: one atomic reset+consume, refunded below if nothing gets delivered
+            if not await consume_search_quota(user_id, limit):
+                outcome = "limit"
+                return await event.reply(f"⚠️ You have reached your daily limit of {limit} search(es). Please wait 24 hours or upgrade to premium.")
+            charged = True
+
+            cache_key = search_cache.make_key(plan.query, result_limit)
+
+            # Popular queries are answered from the cache without touching the cluster
+            results = await search_cache.get(cache_key)
+            if results is None:
+                # Check API Status
+                with SEARCH_STAGE_SECONDS.time(stage="status"):
+                    is_ready, status_msg = await check_api_status()
+                if not is_ready:
+                    outcome = "not_ready"
+                    return await event.reply(f"⏳ Backend is not ready. {status_msg} Please try again in a minute.")
+                if plan.too_expensive:
+                    # Past runs of this query (or ones like it) took longer than the tier's budget
+                    outcome = "too_expensive"
+                    return await event.reply(
+                        f"⏳ This query usually takes longer than your tier's {plan.budget:g}s search budget. "
+                        f"Please use a more specific query. It was not counted against your limit."
+                    )
+
+            wait_msg = await event.reply("🔎 You have been added to the queue. Processing...")
+
+            async def show_position(position: int, eta: float):
+                minutes, seconds = divmod(int(eta), 60)
+                await wait_msg.edit(f"🔎 You are **#{position}** in the queue (ETA ~{minutes}m {seconds}s). Send /cancel to leave the queue.")
+
+            async def still_eligible():
+                # The user may have been banned while waiting in the queue (their quota is already reserved)
+                fresh = await get_user(user_id)
+                if fresh and fresh.get("is_banned"):
+                    return "🚫 You are banned from using this bot."
+                return None
+
+            async def run_job():
+                # Cluster mode: a worker process runs the search under the global job cap
+                editor = ThrottledEditor(wait_msg, SEARCH_PROGRESS_INTERVAL)
+                try:
+                    with SEARCH_STAGE_SECONDS.time(stage="fetch"):
+                        results = await job_client.run(
+                            user_id, is_premium, plan.query, result_limit, max_lines, max_bytes, budget=plan.budget,
+                            on_position=show_position,
+                            on_progress=lambda snapshot: editor.update(progress_text(snapshot))
+                        )
+                    query_analyzer.record(plan, results.elapsed, results.over_budget)
+                    return results
+                finally:
+                    editor.close()
+
+            async def run_search():
+                # Process Queue
+                with SEARCH_STAGE_SECONDS.time(stage="queue"):
+                    await search_scheduler.acquire(ticket, on_update=show_position, precheck=still_eligible)
+                await wait_msg.edit("🔎 Processing your query across the cluster...\nSend /cancel to stop this search.")
+                # Per-node progress, edited as nodes finish but never more often than SEARCH_PROGRESS_INTERVAL
+                editor = ThrottledEditor(wait_msg, SEARCH_PROGRESS_INTERVAL)
+                try:
+                    with SEARCH_STAGE_SECONDS.time(stage="fetch"):
+                        results = await fetch_search_results(
+                            plan.query, limit=result_limit, max_lines=max_lines, max_bytes=max_bytes,
+                            on_progress=lambda progress: editor.update(progress_text(progress.snapshot())),
+                            budget=plan.budget
+                        )
+                    query_analyzer.record(plan, results.elapsed, results.over_budget)
+                    return results
+                finally:
+                    editor.close()
+                    search_scheduler.release_slot(ticket)
+
+            if results is None:
+                # Identical searches already in flight share one backend fetch (and one queue slot)
+                # Run as its own task so /cancel can abort the queue wait or the node streams
+                search_task = asyncio.create_task(search_cache.get_or_fetch(cache_key, run_job if JOB_QUEUE_ENABLED else run_search))
+                active_searches[user_id] = search_task
+                try:
+                    results = await search_task
+                except SearchDropped as dropped:
+                    outcome = "dropped"
+                    return await wait_msg.edit(dropped.reason)
+                except asyncio.CancelledError:
+                    if not search_task.cancelled():
+                        # The handler itself is being cancelled (shutdown), not the search
+                        search_task.cancel()
+                        raise
+                    outcome = "cancelled"
+                    return await wait_msg.edit("🛑 Search cancelled. It was not counted against your daily limit.")
+                finally:
+                    active_searches.pop(user_id, None)
 
-        # Process Queue
-        async with search_queue_semaphore:
-            await wait_msg.edit("🔎 Processing your query across the cluster...")
-            results = await fetch_search_results(query, limit=result_limit)
-            
             if not results:
+                outcome = "no_results"
                 await wait_msg.edit("❌ No results found globally for your query.")
-            elif all("Error" in r or "Failed" in r for r in results):
+            elif results.hit_count == 0:
                 # If everything returned was an error
-                await wait_msg.edit(f"⚠️ {results[0]}")
+                outcome = "error"
+                await wait_msg.edit(f"⚠️ {results.errors[0]}")
             else:
-                # Always safely paste the output securely to prevent message limit issues 
-                # and to obscure data from being logged directly in Telegram chat history.
-                await wait_msg.edit("📝 Generating a secure paste for your results...")
-                full_text = "\n".join(results)
-                paste_url = await create_paste(full_text)
-                
-                if paste_url:
-                    await wait_msg.edit(
-                        f"✅ **Found {len(results)} result(s)**\n\n"
-                        f"🔗 [View Full Results Securely]({paste_url})\n\n"
-                        f"⚠️ **Note:** This link will permanently self-destruct after it is opened once.", 
-                        link_preview=False
-                    )
-                else:
-                    # Fallback if pastebin fails
-                    result_text = "\n".join(results[:15])
-                    if len(results) > 15:
-                        result_text += f"\n\n... and {len(results)-15} more lines."
-                    await wait_msg.edit(f"✅ **Found {len(results)} result(s)**\n_(Pastebin upload failed)_\n\n`{result_text}`")
-                
+                if not await deliver_results(client, event, wait_msg, results):
+                    outcome = "undelivered"
+                    return
+                delivered = True
+                outcome = "ok"
+                if results.over_budget:
+                    # Partial result cut off by the tier's time budget: delivered, but not counted
+                    outcome = "over_budget"
+                    await refund_search_quota(user_id)
+            
                 # Update usage stats
-                await increment_search_usage(user_id, len(results))
+                record_search_stats(results.hit_count)
+        finally:
+            search_scheduler.release(ticket)
+            if charged and not delivered:
+                await refund_search_quota(user_id)
+            SEARCH_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+            SEARCHES_TOTAL.inc(outcome=outcome)
+
+    @router.command("cancel")
+    async def cancel_cmd(event: Message, args: str, user: None):
+        task = active_searches.get(event.sender_id)
+        if not task or task.done():
+            return await event.reply("ℹ️ You have no search in progress.")
+        # The search handler frees the scheduler slot, refunds the quota and edits its own message
+        task.cancel()
 
-    @client.on(events.NewMessage(pattern=r'^/redeem (.*)'))
-    async def redeem_cmd(event: Message):
+    @router.command("redeem", args=r"\S+", load_user=True, usage="/redeem <key>")
+    async def redeem_cmd(event: Message, key_str: str, user: dict | None):
         user_id = event.sender_id
-        key_str = event.pattern_match.group(1).strip()
         
-        key_doc = await keys_col.find_one({"key_string": key_str, "is_used": False})
-        if not key_doc:
+        duration_days = await redeem_key(user_id, key_str)
+        if duration_days is None:
             return await event.reply("❌ Invalid or already used key.")
-            
-        # Update key
-        await keys_col.update_one({"_id": key_doc["_id"]}, {"$set": {"is_used": True, "used_by": user_id}})
-        
-        # Apply premium to user
-        user = await get_user(user_id)
-        if not user:
-            user = await create_user(user_id)
-            
-        current_expiry = user.get('premium_expiry') or datetime.utcnow()
-        if current_expiry < datetime.utcnow():
-            current_expiry = datetime.utcnow()
-            
-        new_expiry = current_expiry + timedelta(days=key_doc['duration_days'])
-        
-        await users_col.update_one(
-            {"user_id": user_id}, 
-            {"$set": {"type": "premium", "premium_expiry": new_expiry, "notified_expiry": False}}
-        )
+        # A short key may already need a reminder; let the expiry scheduler recompute its deadline
+        wake_expiry_scheduler()
         
-        await event.reply(f"✅ Successfully redeemed! You now have Premium access for {key_doc['duration_days']} days.")
+        await event.reply(f"✅ Successfully redeemed! You now have Premium access for {duration_days} days.")
 
-    @client.on(events.NewMessage(pattern=r'^/account'))
-    async def account_cmd(event: Message):
+    @router.command("account", load_user=True, create=True)
+    async def account_cmd(event: Message, args: str, user: dict):
         user_id = event.sender_id
-        user = await get_user(user_id)
-        if not user:
-            user = await create_user(user_id)
-            
+
         referral_count = user.get('referral_count', 0)
         
         msg = f"👤 **Account Info**\n\n"
@@ -206,14 +283,13 @@ def register_user_handlers(client: TelegramClient):
                 msg += "**Premium Ends In:** `Expired`\n"
         
         # Add their unique link
-        bot_me = await client.get_me()
-        ref_link = f"https://t.me/{bot_me.username}?start={user_id}"
+        ref_link = f"https://t.me/{await get_bot_username(client)}?start={user_id}"
         msg += f"\n🎁 **Referral Link:**\n`{ref_link}`"
         
         await event.reply(msg)
 
-    @client.on(events.NewMessage(pattern=r'^/stats'))
-    async def stats_cmd(event: Message):
+    @router.command("stats")
+    async def stats_cmd(event: Message, args: str, user: None):
         stats = await get_stats()
         msg = (
             "📊 **Bot Statistics**\n\n"
@@ -223,4 +299,18 @@ def register_user_handlers(client: TelegramClient):
             f"🔍 **Total Searches:** {stats['total_searches']}\n"
             f"📝 **Results Fetched:** {stats['total_results']}"
         )
+        if event.sender_id == ADMIN_ID:
+            cache = search_cache.stats()
+            msg += (
+                "\n\n🗄 **Result Cache:**\n"
+                f"Hits: {cache['hits']} (disk: {cache['disk_hits']}) | Misses: {cache['misses']} | "
+                f"Coalesced: {cache['coalesced']}\n"
+                f"Hit Rate: {cache['hit_rate']:.1%} | Entries: {cache['entries']} ({cache['bytes'] // 1024} KB)"
+            )
+            users = user_cache.stats()
+            msg += (
+                "\n\n👤 **User Cache:**\n"
+                f"Hits: {users['hits']} | Misses: {users['misses']} | "
+                f"Hit Rate: {users['hit_rate']:.1%} | Entries: {users['entries']}"
+            )
         await event.reply(msg)
\ No newline at end of file